@@ -1,29 +1,22 @@
+import os
 import sys
+import time
+import struct
+import logging
+import argparse
 
-print("""SET CPU 11/70,4M
+import simhremote
+
+HEADER = """SET CPU 11/70,4M
 ;SET REALCONS=localhost
 ;SET REALCONS panel=11/70
 ;SET REALCONS interval=8
 ;SET REALCONS connected
 
-""")
 
-for line in sys.stdin:
-    print('; ' + line, end='')
-    
-    lineno = line[:9]
-    data = line[9:40].replace("'", '')
-    code = line[40:]
+"""
 
-    data = data.split()
-    if data:
-        addr = int(data[0], 8)  
-        data = data[1:]
-        for d in data:
-            print('D ' + oct(addr)[2:] + ' ' + d)
-            addr += 2
-    
-print("""
+FOOTER = """
 
 RESET ALL
 SET CPU IDLE
@@ -31,4 +24,453 @@ D PSW 000340
 D PC  000000
 E PC
 echo "RUN to start from PC"
-""")
\ No newline at end of file
+
+"""
+
+# Split a listing line into the address and the data fields assembled there.
+# Words show up as six octal digits, bytes as three. Relocation marks are dropped.
+def parseline(line):
+
+    data = line[9:40].replace("'", '').split()
+    if not data:
+        return (None, [])
+
+    return (int(data[0], 8), data[1:])
+
+# Deposit one data field into the memory image and return the next address. The
+# image maps even addresses to 16-bit words, bytes go into the low or high half.
+def deposit(image, addr, field):
+
+    value = int(field, 8)
+
+    if len(field) > 3:
+        image[addr] = value
+        return addr + 2
+
+    word = addr & ~1
+    if addr & 1:
+        image[word] = (image.get(word, 0) & 0o377) | (value << 8)
+    else:
+        image[word] = (image.get(word, 0) & 0o177400) | value
+
+    return addr + 1
+
+# Build the memory image for all lines of a listing.
+def buildimage(lines, image=None):
+
+    if image is None:
+        image = {}
+
+    for line in lines:
+        (addr, data) = parseline(line)
+        for field in data:
+            addr = deposit(image, addr, field)
+
+    return image
+
+# Write the simh script for a listing, each line of it followed by its deposits.
+# Returns the number of D commands written.
+def writescript(lines, out):
+
+    image = {}
+    commands = 0
+
+    out.write(HEADER)
+
+    for line in lines:
+        out.write('; ' + line)
+
+        (addr, data) = parseline(line)
+        for field in data:
+            word = addr & ~1
+            addr = deposit(image, addr, field)
+
+            # Bytes are merged with what is already in the word they go to.
+            if len(field) <= 3:
+                field = '{:06o}'.format(image[word])
+
+            out.write('D ' + oct(word)[2:] + ' ' + field + '\n')
+            commands += 1
+
+    out.write(FOOTER)
+
+    return commands
+
+# Write a simh script that deposits a memory image, one word per D command in
+# ascending address order. Returns the number of D commands written.
+def writeimage(image, out, header=HEADER):
+
+    out.write(header)
+
+    for addr in sorted(image):
+        out.write('D {addr:o} {value:06o}\n'.format(addr=addr, value=image[addr]))
+
+    out.write(FOOTER)
+
+    return len(image)
+
+SNAPSHOTMAGIC = b'LSTSNAP1'
+
+# Save a memory image as it was loaded, to compare the next one against. The
+# snapshot holds its runs of words, each as address and length in bytes
+# followed by the bytes, little endian like the PDP-11.
+def writesnapshot(image, filename):
+
+    with open(filename + '.tmp', 'wb') as snapshotfile:
+        snapshotfile.write(SNAPSHOTMAGIC)
+        for (addr, data) in runs(image):
+            snapshotfile.write(struct.pack('<II', addr, len(data)))
+            snapshotfile.write(data)
+    os.replace(filename + '.tmp', filename)
+
+def readsnapshot(filename):
+
+    with open(filename, 'rb') as snapshotfile:
+        data = snapshotfile.read()
+
+    if not data.startswith(SNAPSHOTMAGIC):
+        raise ValueError('{filename} is not a snapshot.'.format(filename=filename))
+
+    image = {}
+    offset = len(SNAPSHOTMAGIC)
+    while offset < len(data):
+        # Each run is its address and length, then its words.
+        if offset + 8 > len(data):
+            raise ValueError('Snapshot {filename} is truncated.'.format(filename=filename))
+        (addr, length) = struct.unpack_from('<II', data, offset)
+        offset += 8
+        if offset + length > len(data):
+            raise ValueError('Snapshot {filename} is truncated.'.format(filename=filename))
+        if length & 1:
+            raise ValueError('Snapshot {filename} is corrupt, a run of {length} bytes is not whole words.'.format(filename=filename, length=length))
+
+        image.update(zip(range(addr, addr + length, 2), struct.unpack_from('<{n}H'.format(n=length // 2), data, offset)))
+        offset += length
+
+    return image
+
+# The words of the new image that are not in the old one or hold another value
+# there. Words only in the old image are left alone, they do no harm.
+def changedwords(old, new):
+
+    return { addr: value for (addr, value) in new.items() if old.get(addr) != value }
+
+# Write a simh script for a simulator that still has the old image in memory,
+# with deposits for the changed words only. Returns the number of D commands.
+def writepatch(old, new, out):
+
+    changed = changedwords(old, new)
+
+    return writeimage(changed, out, '; Patch: {n} of {total} words changed\n\n'.format(n=len(changed), total=len(new)))
+
+# The commands that load a memory image into a running simh and get it ready
+# to start like the FOOTER of a script does.
+def depositcommands(image, start=0):
+
+    for addr in sorted(image):
+        yield 'D {addr:o} {value:06o}'.format(addr=addr, value=image[addr])
+
+    yield 'D PSW 000340'
+    yield 'D PC {start:06o}'.format(start=start)
+
+# Load a memory image into the simh listening at address, host:port, over its
+# remote console. Returns the number of commands.
+def depositremote(image, address, start=0, window=256, blocksize=4096):
+
+    (host, _, port) = address.rpartition(':')
+    commands = list(depositcommands(image, start))
+
+    with simhremote.RemoteConsole(host or 'localhost', int(port)) as console:
+        complaints = console.run(commands, window, blocksize)
+
+    if complaints:
+        raise ValueError('simh refused {n} command{s}, the first was \'{command}\': {output}'.format(
+            n = len(complaints),
+            s = '' if len(complaints) == 1 else 's',
+            command = complaints[0][0],
+            output = complaints[0][1]
+        ))
+
+    return len(commands)
+
+# Lay a memory image out as raw bytes from its lowest to its highest address,
+# gaps are zero-filled. Returns the base address and the bytes.
+def rawbytes(image):
+
+    if not image:
+        return (0, bytearray())
+
+    base = min(image)
+    data = bytearray(max(image) + 2 - base)
+    for (addr, value) in image.items():
+        data[addr - base] = value & 0o377
+        data[addr - base + 1] = value >> 8
+
+    return (base, data)
+
+# Split a memory image into runs of consecutive words. Yields the start address
+# and the bytes of each run.
+def runs(image):
+
+    addr = None
+    data = bytearray()
+    for word in sorted(image):
+        if data and (word != addr + len(data)):
+            yield (addr, data)
+            data = bytearray()
+        if not data:
+            addr = word
+        value = image[word]
+        data.append(value & 0o377)
+        data.append(value >> 8)
+
+    if data:
+        yield (addr, data)
+
+ABSBLOCKSIZE = 256
+
+# One block in absolute loader format: 001 000, byte count including the six
+# header bytes, load address, data and a checksum that makes the block sum to 0.
+def absblock(addr, data):
+
+    if addr > 0o177777:
+        raise ValueError('Address {addr:o} is out of reach of the absolute loader.'.format(addr=addr))
+
+    count = len(data) + 6
+    header = (1, 0, count & 0o377, count >> 8, addr & 0o377, addr >> 8)
+
+    yield from header
+    yield from data
+    yield -(sum(header) + sum(data)) & 0o377
+
+# The absolute loader only reaches the low 64KB. Raise ValueError naming the
+# first address of an image that does not fit, before any tape is produced.
+def checkabsloader(image):
+
+    high = [addr for addr in image if addr > 0o177776]
+    if high:
+        raise ValueError('Address {addr:o} is out of reach of the absolute loader.'.format(addr=min(high)))
+
+# Yield the bytes of an absolute loader tape for a memory image. The closing
+# block carries the start address, an odd one makes the loader halt instead.
+def absloader(image, start=1):
+
+    for (addr, data) in runs(image):
+        for offset in range(0, len(data), ABSBLOCKSIZE):
+            yield from absblock(addr + offset, data[offset:offset + ABSBLOCKSIZE])
+
+    yield from absblock(start, b'')
+
+# Split formatted binary data into its blocks. Yields the payload of each block
+# after the 001 000 header and byte count, without the checksum.
+def formattedblocks(data):
+
+    offset = 0
+    while offset < len(data):
+        # Skip leader and filler between blocks.
+        if data[offset] != 1:
+            offset += 1
+            continue
+
+        if (offset + 4 > len(data)) or (data[offset + 1] != 0):
+            raise ValueError('Bad formatted binary block at offset {offset}.'.format(offset=offset))
+
+        count = data[offset + 2] | (data[offset + 3] << 8)
+        block = data[offset:offset + count + 1]
+        if (count < 4) or (len(block) != count + 1) or (sum(block) & 0o377):
+            raise ValueError('Bad formatted binary block at offset {offset}.'.format(offset=offset))
+
+        yield block[4:count]
+        offset += count + 1
+
+# Name of the absolute section ". ABS." in RAD50
+ABSSECTION = bytes((0o001, 0o257, 0o224, 0o017))
+
+# Load the text records of an RT-11 object module into the memory image. Only
+# absolute sections are supported, relocation is left to the linker.
+def readobject(data, image=None):
+
+    if image is None:
+        image = {}
+
+    relocated = False
+    for record in formattedblocks(data):
+        recordtype = record[0] | (record[1] << 8)
+
+        if recordtype == 3:
+            # TXT: load address followed by the data bytes.
+            addr = record[2] | (record[3] << 8)
+            for value in record[4:]:
+                word = addr & ~1
+                if addr & 1:
+                    image[word] = (image.get(word, 0) & 0o377) | (value << 8)
+                else:
+                    image[word] = (image.get(word, 0) & 0o177400) | value
+                addr += 1
+
+        elif recordtype == 4:
+            # RLD: anything but location counter entries for the absolute
+            # section needs a linker.
+            offset = 2
+            while offset < len(record):
+                entry = record[offset] & 0o177
+                if (entry == 7) and (record[offset + 2:offset + 6] == ABSSECTION):
+                    offset += 8
+                elif entry == 8:
+                    offset += 4
+                else:
+                    relocated = True
+                    break
+
+    if relocated:
+        raise ValueError('Object module needs relocation, only absolute code can be loaded.')
+
+    return image
+
+# Set up argparse and get the command line options.
+def parse_commandline():
+
+    global options
+
+    parser = argparse.ArgumentParser(
+        description = 'Convert a MACRO-11 listing to a simh script of deposits, or deposit it into a running simh.',
+    )
+
+    parser.add_argument('-ll', '--log-level',
+        action = 'store',
+        default = 'INFO',
+        help ='Set the logging output level to CRITICAL, ERROR, WARNING, INFO or DEBUG (default: %(default)s)',
+        dest ='log_level',
+        metavar = 'level'
+    )
+
+    parser.add_argument('-if', '--input-file',
+        action = 'store',
+        default = '',
+        help = 'Listing to read, stdin if not given (default: %(default)s)',
+        dest = 'inputfilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-of', '--output-file',
+        action = 'store',
+        default = '',
+        help = 'simh script to write, stdout if not given (default: %(default)s)',
+        dest = 'outputfilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-rc', '--remote-console',
+        action = 'store',
+        default = '',
+        help = 'Instead of writing a script deposit into the simh with its remote console at host:port (default: %(default)s)',
+        dest = 'remoteconsole',
+        metavar = 'host:port'
+    )
+
+    parser.add_argument('-sa', '--start-address',
+        action = 'store',
+        default = '0',
+        help = 'With -rc: Octal address to set the PC to after loading (default: %(default)s)',
+        dest = 'startaddress',
+        metavar = 'octal'
+    )
+
+    parser.add_argument('-sn', '--snapshot',
+        action = 'store',
+        default = '',
+        help = 'Keep the image last written or deposited in this file and from then on only write or deposit the words that changed (default: %(default)s)',
+        dest = 'snapshotfilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-wn', '--window',
+        action = 'store',
+        default = 256,
+        type = int,
+        help = 'With -rc: How many commands may wait for their answer from simh at a time (default: %(default)s)',
+        dest = 'window',
+        metavar = 'count'
+    )
+
+    parser.add_argument('-bs', '--block-size',
+        action = 'store',
+        default = 4096,
+        type = int,
+        help = 'With -rc: Send commands in blocks of about this many bytes (default: %(default)s)',
+        dest = 'blocksize',
+        metavar = 'bytes'
+    )
+
+    options = parser.parse_args()
+    options.log_level_int = getattr(logging, options.log_level, logging.INFO)
+    options.startaddress = int(options.startaddress, 8)
+
+def setup_logging():
+
+    global options
+
+    ch = logging.StreamHandler()
+    ch.setLevel(options.log_level_int)
+    ch.setFormatter(logging.Formatter('[{levelname:7}] {name} - {message}', style='{'))
+
+    root = logging.getLogger()
+    root.addHandler(ch)
+    root.setLevel(options.log_level_int)
+
+def main():
+
+    global options
+
+    parse_commandline()
+    setup_logging()
+
+    logger = logging.getLogger('main')
+
+    inputfile = open(options.inputfilename, 'r') if options.inputfilename else sys.stdin
+    try:
+        lines = list(inputfile)
+    finally:
+        if inputfile is not sys.stdin:
+            inputfile.close()
+
+    # The image loaded last time, if there is one to patch.
+    old = None
+    if options.snapshotfilename and os.path.exists(options.snapshotfilename):
+        try:
+            old = readsnapshot(options.snapshotfilename)
+        except ValueError as e:
+            logger.error(e)
+            sys.exit(1)
+
+    image = buildimage(lines) if (options.remoteconsole or options.snapshotfilename) else None
+
+    if options.remoteconsole:
+        start = time.perf_counter()
+        try:
+            commands = depositremote(image if old is None else changedwords(old, image), options.remoteconsole, options.startaddress, options.window, options.blocksize)
+        except (OSError, ValueError) as e:
+            logger.error(e)
+            sys.exit(1)
+
+        logger.info('{commands} commands deposited in {ms:.0f}ms.'.format(
+            commands = commands,
+            ms = (time.perf_counter() - start) * 1000
+        ))
+    else:
+        outputfile = open(options.outputfilename, 'w') if options.outputfilename else sys.stdout
+        try:
+            if old is None:
+                writescript(lines, outputfile)
+            else:
+                commands = writepatch(old, image, outputfile)
+                logger.info('{commands} of {words} words changed since the snapshot.'.format(commands=commands, words=len(image)))
+        finally:
+            if outputfile is not sys.stdout:
+                outputfile.close()
+
+    if options.snapshotfilename:
+        writesnapshot(image, options.snapshotfilename)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import io
+import os
+import sys
+import time
+import random
+import argparse
+
+import lsttosimh
+
+# Set up argparse and get the command line options.
+def parse_commandline():
+
+    global options
+
+    parser = argparse.ArgumentParser(
+        description = 'Benchmark lsttosimh on synthetic MACRO-11 listings.',
+    )
+
+    parser.add_argument('-l', '--lines',
+        action = 'store',
+        default = '10,1000,100000,1000000',
+        help = 'Comma-separated list of listing sizes in lines to benchmark (default: %(default)s)',
+        dest = 'lines',
+        metavar = 'list'
+    )
+
+    parser.add_argument('-s', '--seed',
+        action = 'store',
+        default = 11,
+        type = int,
+        help = 'Seed for the random generator so corpora are reproducible (default: %(default)s)',
+        dest = 'seed',
+        metavar = 'num'
+    )
+
+    parser.add_argument('-cd', '--corpus-dir',
+        action = 'store',
+        default = '',
+        help = 'When given write the generated listings there as bench.<lines>.lst (default: %(default)s)',
+        dest = 'corpusdir',
+        metavar = 'directory'
+    )
+
+    options = parser.parse_args()
+    options.lines = [int(n) for n in options.lines.split(',')]
+
+# Format one listing line the way MACRO-11 does: line number, address and data
+# in the first 40 columns, then the source.
+def listingline(lineno, addr, fields, source):
+
+    data = '' if addr is None else '{:06o}'.format(addr)
+    for field in fields:
+        data += ' ' + field
+
+    return '{lineno:8d} {data:31}{source}\n'.format(lineno=lineno, data=data, source=source)
+
+# Generate a synthetic listing of about count lines with a mix of .ASECT
+# origins, instructions, byte data and .BLKB blocks. Returns the lines and the
+# memory image they describe, worked out independently of lsttosimh.
+def generatelisting(count, rng):
+
+    lines = []
+    expected = {}
+
+    def putbyte(addr, value):
+        word = addr & ~1
+        if addr & 1:
+            expected[word] = (expected.get(word, 0) & 0o377) | (value << 8)
+        else:
+            expected[word] = (expected.get(word, 0) & 0o177400) | value
+
+    addr = 0
+    lineno = 0
+    while len(lines) < count:
+        lineno += 1
+        kind = rng.random()
+
+        if kind < 0.02:
+            # New origin somewhere in the low 56KB.
+            addr = rng.randrange(0, 0o160000, 2)
+            lines.append(listingline(lineno, None, [], '\t.ASECT'))
+            lineno += 1
+            lines.append(listingline(lineno, addr, [], '\t.=' + '{:o}'.format(addr)))
+
+        elif kind < 0.04:
+            # Storage block, only the address shows up in the listing.
+            size = rng.choice((1, 2, 64, 128, 4096))
+            lines.append(listingline(lineno, addr, [], '\t.BLKB\t{:d}.'.format(size)))
+            addr += size
+
+        elif kind < 0.20:
+            # Byte data, up to six bytes to a line.
+            values = [rng.randrange(0, 0o400) for _ in range(rng.randint(1, 6))]
+            lines.append(listingline(lineno, addr, ['{:03o}'.format(v) for v in values], '\t.BYTE\t' + ','.join('{:o}'.format(v) for v in values)))
+            for v in values:
+                putbyte(addr, v)
+                addr += 1
+
+        elif kind < 0.25:
+            # Pure comment line.
+            lines.append(listingline(lineno, None, [], '; Comment'))
+
+        else:
+            # An instruction of one to three words, word aligned.
+            if addr & 1:
+                addr += 1
+            values = [rng.randrange(0, 0o200000) for _ in range(rng.randint(1, 3))]
+            fields = ['{:06o}'.format(v) + ("'" if rng.random() < 0.1 else '') for v in values]
+            lines.append(listingline(lineno, addr, fields, '\tMOV\t#1,@#177570'))
+            for v in values:
+                expected[addr] = v
+                addr += 2
+
+    return (lines, expected)
+
+# Interpret a simh script the way simh does: every D command stores a word.
+def replayscript(script):
+
+    image = {}
+    for line in script.splitlines():
+        if line.startswith('D '):
+            (_, addr, value) = line.split()
+            if addr.isdigit():
+                image[int(addr, 8)] = int(value, 8)
+
+    return image
+
+def timed(func, *args):
+
+    start = time.perf_counter()
+    result = func(*args)
+    return (result, time.perf_counter() - start)
+
+def benchmark(count, rng):
+
+    (lines, expected) = generatelisting(count, rng)
+
+    if options.corpusdir:
+        with open(os.path.join(options.corpusdir, 'bench.{:d}.lst'.format(count)), 'w') as corpusfile:
+            corpusfile.writelines(lines)
+
+    (_, parsetime) = timed(lambda: [lsttosimh.parseline(line) for line in lines])
+    (image, buildtime) = timed(lsttosimh.buildimage, lines)
+
+    script = io.StringIO()
+    (scriptcommands, scripttime) = timed(lsttosimh.writescript, lines, script)
+
+    imagescript = io.StringIO()
+    (imagecommands, imagetime) = timed(lsttosimh.writeimage, image, imagescript)
+
+    # Check all three results against the generator's own idea of memory.
+    ok = (image == expected) and (replayscript(script.getvalue()) == expected) and (replayscript(imagescript.getvalue()) == expected)
+
+    def rate(seconds):
+        return count / seconds if seconds else float('inf')
+
+    print('{count:9d} lines: parse {parse:10.0f} l/s, build {build:10.0f} l/s, script {script:10.0f} l/s ({scriptcommands:d} D), image {image:8.3f}s ({imagecommands:d} D) {ok}'.format(
+        count = count,
+        parse = rate(parsetime),
+        build = rate(buildtime),
+        script = rate(scripttime),
+        scriptcommands = scriptcommands,
+        image = imagetime,
+        imagecommands = imagecommands,
+        ok = 'OK' if ok else 'MISMATCH'
+    ))
+
+    return ok
+
+def main():
+
+    global options
+
+    parse_commandline()
+
+    rng = random.Random(options.seed)
+
+    ok = True
+    for count in options.lines:
+        ok = benchmark(count, rng) and ok
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
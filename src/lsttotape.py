@@ -0,0 +1,91 @@
+import os
+import sys
+import shlex
+import logging
+import argparse
+
+import lsttosimh
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'tape2svg'))
+import tape2svg
+
+# Set up argparse and get the command line options.
+def parse_commandline():
+
+    global options
+
+    parser = argparse.ArgumentParser(
+        description = 'Punch an assembled MACRO-11 program as absolute loader paper tape in one go.',
+    )
+
+    parser.add_argument('-if', '--input-file',
+        action = 'store',
+        default = '',
+        help = 'Listing (.lst) or object module (.obj) to read, a listing from stdin if not given (default: %(default)s)',
+        dest = 'inputfilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-sa', '--start-address',
+        action = 'store',
+        default = '1',
+        help = 'Octal address the loader jumps to after loading, odd to halt instead (default: %(default)s)',
+        dest = 'startaddress',
+        metavar = 'octal'
+    )
+
+    parser.add_argument('-to', '--tape2svg-options',
+        action = 'store',
+        default = '',
+        help = 'Extra command line options for tape2svg (default: %(default)s)',
+        dest = 'tape2svgoptions',
+        metavar = 'string'
+    )
+
+    options = parser.parse_args()
+    options.startaddress = int(options.startaddress, 8)
+
+# Punch a memory image as absolute loader tape with tape2svg, in this process.
+# The loader bytes go straight into tape2svg's tape, no file in between.
+def punchimage(image, start, args):
+
+    lsttosimh.checkabsloader(image)
+
+    tape2svg.parse_commandline(args)
+    tape2svg.options.inputdata = lambda: lsttosimh.absloader(image, start)
+
+    # Callers that set up their own logging keep it.
+    if not logging.getLogger().handlers:
+        tape2svg.setup_logging()
+    tape2svg.render()
+
+def main():
+
+    global options
+
+    parse_commandline()
+
+    args = shlex.split(options.tape2svgoptions)
+
+    try:
+        if options.inputfilename:
+            if os.path.splitext(options.inputfilename)[1].lower() == '.obj':
+                with open(options.inputfilename, 'rb') as inputfile:
+                    image = lsttosimh.readobject(inputfile.read())
+            else:
+                with open(options.inputfilename, 'r') as inputfile:
+                    image = lsttosimh.buildimage(inputfile)
+
+            # Name the output after the input unless told otherwise.
+            if not ('-of' in args or '--output-file' in args):
+                args += ['-of', os.path.splitext(options.inputfilename)[0] + '.svg']
+        else:
+            image = lsttosimh.buildimage(sys.stdin)
+
+        punchimage(image, options.startaddress, args)
+
+    except ValueError as e:
+        sys.exit('lsttotape: {error}'.format(error=e))
+
+if __name__ == '__main__':
+    main()
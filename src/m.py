@@ -0,0 +1,307 @@
+import os
+import re
+import sys
+import json
+import time
+import shlex
+import hashlib
+import logging
+import argparse
+import subprocess
+
+import lsttosimh
+
+# Set up argparse and get the command line options.
+def parse_commandline():
+
+    global options
+
+    parser = argparse.ArgumentParser(
+        description = 'Assemble MACRO-11 sources and convert them for simh, skipping whatever is up to date.',
+    )
+
+    parser.add_argument('sources',
+        nargs = '+',
+        help = 'MACRO-11 source files, the .mac extension is optional',
+        metavar = 'source'
+    )
+
+    parser.add_argument('-ll', '--log-level',
+        action = 'store',
+        default = 'INFO',
+        help ='Set the logging output level to CRITICAL, ERROR, WARNING, INFO or DEBUG (default: %(default)s)',
+        dest ='log_level',
+        metavar = 'level'
+    )
+
+    parser.add_argument('-as', '--assembler',
+        action = 'store',
+        default = ('macro11.exe' if os.name == 'nt' else 'macro11') + ' -l {lst} -o {obj} {mac}',
+        help = 'Command to run the assembler, {mac}, {lst} and {obj} are replaced by the file names (default: %(default)s)',
+        dest = 'assembler',
+        metavar = 'command'
+    )
+
+    parser.add_argument('-cf', '--cache-file',
+        action = 'store',
+        default = '.m.cache',
+        help = 'File next to the sources that remembers what they were built from (default: %(default)s)',
+        dest = 'cachefilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-f', '--force',
+        action = 'store_true',
+        help = 'Rebuild everything even if it looks up to date',
+        dest = 'force'
+    )
+
+    parser.add_argument('-w', '--watch',
+        action = 'store_true',
+        help = 'Keep running and rebuild whenever a source or one of its includes is saved',
+        dest = 'watch'
+    )
+
+    parser.add_argument('-wi', '--watch-interval',
+        action = 'store',
+        default = 0.02,
+        type = float,
+        help = 'How often to look for changes in watch mode in seconds (default: %(default)s)',
+        dest = 'watchinterval',
+        metavar = 'seconds'
+    )
+
+    parser.add_argument('-rc', '--remote-console',
+        action = 'store',
+        default = '',
+        help = 'Deposit every rebuilt program into the simh with its remote console at host:port (default: %(default)s)',
+        dest = 'remoteconsole',
+        metavar = 'host:port'
+    )
+
+    parser.add_argument('-sa', '--start-address',
+        action = 'store',
+        default = '0',
+        help = 'With -rc: Octal address to set the PC to after loading (default: %(default)s)',
+        dest = 'startaddress',
+        metavar = 'octal'
+    )
+
+    options = parser.parse_args()
+    options.log_level_int = getattr(logging, options.log_level, logging.INFO)
+    options.startaddress = int(options.startaddress, 8)
+
+    options.sources = [s if os.path.splitext(s)[1] else s + '.mac' for s in options.sources]
+
+def setup_logging():
+
+    global options
+
+    ch = logging.StreamHandler()
+    ch.setLevel(options.log_level_int)
+    ch.setFormatter(logging.Formatter('[{levelname:7}] {name} - {message}', style='{'))
+
+    root = logging.getLogger()
+    root.addHandler(ch)
+    root.setLevel(options.log_level_int)
+
+INCLUDE = re.compile(r'^\s*\.(INCLUDE|LIBRARY)\s+(\S)(.+?)\2', re.IGNORECASE | re.MULTILINE)
+
+# A source and every file it pulls in with .INCLUDE or .LIBRARY, recursively.
+def dependencies(filename, found=None):
+
+    if found is None:
+        found = []
+
+    if (filename in found) or not os.path.exists(filename):
+        return found
+
+    found.append(filename)
+
+    with open(filename, 'r', errors='replace') as sourcefile:
+        for match in INCLUDE.finditer(sourcefile.read()):
+            dependencies(os.path.join(os.path.dirname(filename), match.group(3)), found)
+
+    return found
+
+def filehash(filename):
+
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# Key for a step: the contents of all inputs plus whatever else decides the
+# result, like the command line of the tool.
+def stepkey(inputs, tool):
+
+    h = hashlib.sha256(tool.encode())
+    for filename in inputs:
+        h.update(filename.encode())
+        h.update(filehash(filename).encode())
+
+    return h.hexdigest()
+
+def loadcache(filename):
+
+    try:
+        with open(filename, 'r') as cachefile:
+            return json.load(cachefile)
+    except (OSError, ValueError):
+        return {}
+
+def savecache(filename, cache):
+
+    with open(filename, 'w') as cachefile:
+        json.dump(cache, cachefile, indent=1, sort_keys=True)
+
+# Run a build step unless the cache says its outputs were made from the same
+# inputs and tool and are still untouched. Steps that ran are counted in
+# options.stepsrun, also when a later step fails.
+def step(cache, name, inputs, outputs, tool, action):
+
+    logger = logging.getLogger('main')
+
+    key = stepkey(inputs, tool)
+    entry = cache.get(name)
+
+    if (not options.force) and entry and (entry['key'] == key) and all(
+        os.path.exists(o) and (filehash(o) == entry['outputs'].get(o)) for o in outputs):
+        logger.debug('{name} is up to date.'.format(name=name))
+        return
+
+    logger.info('Building {name}.'.format(name=name))
+
+    for o in outputs:
+        if os.path.exists(o):
+            os.remove(o)
+
+    action()
+    options.stepsrun += 1
+
+    cache[name] = {
+        'key': key,
+        'outputs': { o: filehash(o) for o in outputs }
+    }
+
+def assemble(mac, lst, obj):
+
+    # Split before filling in the names so paths with spaces stay one argument.
+    command = [token.format(mac=mac, lst=lst, obj=obj) for token in shlex.split(options.assembler, posix=(os.name != 'nt'))]
+    subprocess.check_call(command)
+
+def convert(lst, simh):
+
+    with open(lst, 'r') as lstfile, open(simh, 'w') as simhfile:
+        lsttosimh.writescript(lstfile, simhfile)
+
+# Deposit the program of a listing into the running simulator. A snapshot
+# next to the listing remembers what it got last time, so after small changes
+# only the changed words are deposited. -f deposits everything again.
+def load(lst):
+
+    logger = logging.getLogger('main')
+
+    snapshot = os.path.splitext(lst)[0] + '.snap'
+
+    with open(lst, 'r') as lstfile:
+        image = lsttosimh.buildimage(lstfile)
+
+    old = {}
+    if os.path.exists(snapshot) and not options.force:
+        old = lsttosimh.readsnapshot(snapshot)
+
+    commands = lsttosimh.depositremote(lsttosimh.changedwords(old, image), options.remoteconsole, options.startaddress)
+    lsttosimh.writesnapshot(image, snapshot)
+    logger.info('Deposited {lst} into {remoteconsole}, {commands} commands.'.format(lst=lst, remoteconsole=options.remoteconsole, commands=commands))
+
+# Bring everything made from one source up to date, and into the simulator
+# when it changed.
+def build(mac):
+
+    (basename, _) = os.path.splitext(mac)
+    lst = basename + '.lst'
+    obj = basename + '.obj'
+    simh = basename + '.simh'
+
+    cachefilename = os.path.join(os.path.dirname(mac), options.cachefilename)
+    cache = loadcache(cachefilename)
+
+    stepsrun = options.stepsrun
+    try:
+        step(cache, mac + ':assemble', dependencies(mac), [lst, obj], options.assembler, lambda: assemble(mac, lst, obj))
+
+        # The converter is a tool like the assembler, changes to it count.
+        step(cache, mac + ':convert', [lst], [simh], filehash(lsttosimh.__file__), lambda: convert(lst, simh))
+    finally:
+        savecache(cachefilename, cache)
+
+    if options.remoteconsole and (options.stepsrun > stepsrun):
+        load(lst)
+
+def buildall():
+
+    logger = logging.getLogger('main')
+
+    options.stepsrun = 0
+    ok = True
+    for mac in options.sources:
+        try:
+            build(mac)
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            logger.error('{mac}: {error}'.format(mac=mac, error=e))
+            ok = False
+
+    logger.info('{ran} step{s} run.'.format(ran=options.stepsrun, s='' if options.stepsrun == 1 else 's'))
+
+    return ok
+
+# Modification times of all sources and their includes.
+def snapshot():
+
+    stamps = {}
+    for mac in options.sources:
+        for filename in dependencies(mac):
+            stamps[filename] = os.stat(filename).st_mtime_ns
+
+    return stamps
+
+# Poll the sources and rebuild as soon as one of them changes.
+def watch():
+
+    logger = logging.getLogger('main')
+    logger.info('Watching {n} source{s}, Ctrl-C to stop.'.format(n=len(options.sources), s='' if len(options.sources) == 1 else 's'))
+
+    stamps = snapshot()
+    while True:
+        time.sleep(options.watchinterval)
+
+        try:
+            current = snapshot()
+        except OSError:
+            # Editors replace files on save, try again next round.
+            continue
+
+        if current != stamps:
+            stamps = current
+            start = time.perf_counter()
+            buildall()
+            logger.info('Rebuilt in {ms:.0f}ms.'.format(ms=(time.perf_counter() - start) * 1000))
+
+def main():
+
+    global options
+
+    parse_commandline()
+    setup_logging()
+
+    ok = buildall()
+
+    if options.watch:
+        try:
+            watch()
+        except KeyboardInterrupt:
+            pass
+    elif not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
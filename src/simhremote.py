@@ -0,0 +1,375 @@
+import time
+import select
+import socket
+import logging
+import argparse
+import collections
+import socketserver
+
+# Talk to a running simh over its remote console, enabled in simh with
+#
+#   SET REMOTE TELNET=2323
+#
+# Commands are sent in blocks without waiting for each answer. simh answers
+# every command with its output, if any, and a new prompt, so counting the
+# prompts tells which commands are done. A window limits how many can be in
+# flight at once.
+
+PROMPT = b'sim> '
+
+# Ctrl-E gets the attention of a simulator that is running.
+WRU = b'\x05'
+
+# Telnet commands and options, see RFC 854 and 857/858.
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+ECHO = 1
+SGA = 3
+
+class RemoteConsole:
+
+    def __init__(self, host, port, timeout=5.0):
+
+        self.timeout = timeout
+        self.telnet = b''
+        self.text = b''
+
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # A simulator that is stopped prompts right away, a running one after
+        # it got its attention.
+        if not self.waitprompt(min(timeout, 1.0)):
+            self.sock.sendall(WRU)
+            if not self.waitprompt(timeout):
+                raise ConnectionError('No simh prompt from {host}:{port}.'.format(host=host, port=port))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    # Take the telnet negotiation out of the received data and answer it. Echo
+    # and suppressing go ahead are welcome from simh, all else is declined.
+    def untelnet(self, data):
+
+        data = self.telnet + data
+        self.telnet = b''
+
+        if not IAC in data:
+            return data
+
+        text = bytearray()
+        replies = bytearray()
+
+        i = 0
+        while i < len(data):
+            if data[i] != IAC:
+                end = data.find(bytes((IAC,)), i)
+                end = len(data) if end < 0 else end
+                text += data[i:end]
+                i = end
+                continue
+
+            # Sequences cut in two by the network are finished next time.
+            if i + 1 >= len(data):
+                break
+            command = data[i + 1]
+
+            if command == IAC:
+                text.append(IAC)
+                i += 2
+            elif command in (WILL, WONT, DO, DONT):
+                if i + 2 >= len(data):
+                    break
+                option = data[i + 2]
+                if command == WILL:
+                    replies += bytes((IAC, DO if option in (ECHO, SGA) else DONT, option))
+                elif command == DO:
+                    replies += bytes((IAC, WONT, option))
+                i += 3
+            elif command == SB:
+                end = data.find(bytes((IAC, SE)), i)
+                if end < 0:
+                    break
+                i = end + 2
+            else:
+                i += 2
+
+        self.telnet = data[i:]
+        if replies:
+            self.sock.sendall(replies)
+
+        return bytes(text)
+
+    # Read what has arrived, waiting up to timeout for something to arrive.
+    # Returns the text before each complete prompt.
+    def receive(self, timeout):
+
+        (readable, _, _) = select.select([self.sock], [], [], timeout)
+        if timeout and not readable:
+            raise TimeoutError('simh did not answer for {timeout:.1f}s.'.format(timeout=timeout))
+
+        if readable:
+            data = self.sock.recv(1 << 16)
+            if not data:
+                raise ConnectionError('simh closed the remote console.')
+            self.text += self.untelnet(data)
+
+        answers = self.text.split(PROMPT)
+        self.text = answers.pop()
+
+        return answers
+
+    # Wait for the first prompt, dropping the greeting before it.
+    def waitprompt(self, timeout):
+
+        deadline = time.monotonic() + timeout
+        try:
+            while not self.receive(max(deadline - time.monotonic(), 0.001)):
+                pass
+        except TimeoutError:
+            return False
+
+        return True
+
+    # Run the commands, keeping up to window of them in flight, sent in blocks
+    # of about blocksize bytes. Returns the commands that said something, with
+    # what they said. A quiet command has done what it was told.
+    def run(self, commands, window=256, blocksize=4096):
+
+        commands = iter(commands)
+        pending = collections.deque()
+        complaints = []
+
+        while True:
+            block = bytearray()
+            while (len(pending) < window) and (len(block) < blocksize):
+                command = next(commands, None)
+                if command is None:
+                    break
+                block += command.encode('ascii') + b'\r\n'
+                pending.append(command)
+
+            if block:
+                self.sock.sendall(block)
+            elif not pending:
+                break
+
+            # Only wait for answers when nothing more may be sent.
+            wait = (len(pending) >= window) or not block
+            for answer in self.receive(self.timeout if wait else 0):
+                command = pending.popleft()
+
+                # simh echoes the command before its output.
+                lines = [line.strip() for line in answer.decode('ascii', 'replace').splitlines()]
+                if lines and (lines[0] == command):
+                    lines = lines[1:]
+                output = '\n'.join(line for line in lines if line)
+                if output:
+                    complaints.append((command, output))
+
+        return complaints
+
+# A stand-in for simh's remote console to try the client without a simulator.
+# It knows just enough commands to load a program: DEPOSIT and EXAMINE of
+# memory and registers, anything else is taken without a word. Each batch of
+# input costs a delay like a real network and simulator would.
+class StandInHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+
+        logger = logging.getLogger('main')
+
+        server = self.server
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.request.sendall(b'\r\nConnected to the PDP-11 simulator REM-CON device, line 0\r\n\r\n'
+            + bytes((IAC, WILL, ECHO, IAC, WILL, SGA)) + PROMPT)
+
+        line = bytearray()
+        telnet = 0
+        skiplf = False
+        commands = 0
+
+        while True:
+            data = self.request.recv(1 << 16)
+            if not data:
+                break
+
+            time.sleep(server.latency)
+
+            reply = bytearray()
+            for byte in data:
+                # Answers to the negotiation, all three bytes long.
+                if telnet:
+                    telnet -= 1
+                    continue
+                if byte == IAC:
+                    telnet = 2
+                    continue
+
+                # Like simh, a line feed or NUL after a carriage return is padding.
+                if skiplf:
+                    skiplf = False
+                    if byte in (0, 10):
+                        continue
+
+                if byte in (13, 10):
+                    skiplf = (byte == 13)
+                    command = line.decode('ascii', 'replace').strip()
+                    line = bytearray()
+
+                    reply += command.encode('ascii') + b'\r\n'
+                    output = server.execute(command)
+                    if output:
+                        reply += output.encode('ascii') + b'\r\n'
+                    reply += PROMPT
+                    commands += 1
+                elif byte == WRU[0]:
+                    reply += b'\r\n' + PROMPT
+                else:
+                    line.append(byte)
+
+            if reply:
+                self.request.sendall(reply)
+
+        logger.info('{commands} commands from {client}, {words} words in memory.'.format(
+            commands = commands,
+            client = '{}:{}'.format(*self.client_address),
+            words = len(server.memory)
+        ))
+
+class StandIn(socketserver.ThreadingTCPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    REGISTERS = ('R0', 'R1', 'R2', 'R3', 'R4', 'R5', 'SP', 'PC', 'PSW')
+
+    def __init__(self, address, latency=0.0, memsize=0o17760000):
+
+        super().__init__(address, StandInHandler)
+
+        self.latency = latency
+        self.memsize = memsize
+        self.memory = {}
+        self.registers = dict.fromkeys(self.REGISTERS, 0)
+
+    def execute(self, command):
+
+        words = command.upper().split()
+        if not words:
+            return ''
+
+        if words[0] in ('D', 'DEP', 'DEPOSIT', 'E', 'EX', 'EXAMINE'):
+            deposit = words[0].startswith('D')
+            if len(words) != (3 if deposit else 2):
+                return 'Too few arguments' if len(words) < (3 if deposit else 2) else 'Too many arguments'
+
+            try:
+                value = int(words[2], 8) if deposit else None
+            except ValueError:
+                return 'Invalid argument'
+            if deposit and not (0 <= value <= 0o177777):
+                return 'Invalid argument'
+
+            if words[1] in self.registers:
+                if deposit:
+                    self.registers[words[1]] = value
+                    return ''
+                return '{name}:\t{value:06o}'.format(name=words[1], value=self.registers[words[1]])
+
+            try:
+                addr = int(words[1], 8)
+            except ValueError:
+                return 'Invalid argument'
+            if addr >= self.memsize:
+                return 'Address space exceeded'
+            if addr & 1:
+                return 'Invalid argument'
+
+            if deposit:
+                self.memory[addr] = value
+                return ''
+            return '{addr:o}:\t{value:06o}'.format(addr=addr, value=self.memory.get(addr, 0))
+
+        return ''
+
+# Set up argparse and get the command line options.
+def parse_commandline():
+
+    global options
+
+    parser = argparse.ArgumentParser(
+        description = 'Run a stand-in for the remote console of simh to load programs into with lsttosimh -rc.',
+    )
+
+    parser.add_argument('-ll', '--log-level',
+        action = 'store',
+        default = 'INFO',
+        help ='Set the logging output level to CRITICAL, ERROR, WARNING, INFO or DEBUG (default: %(default)s)',
+        dest ='log_level',
+        metavar = 'level'
+    )
+
+    parser.add_argument('-p', '--port',
+        action = 'store',
+        default = 2323,
+        type = int,
+        help = 'TCP port to listen on (default: %(default)s)',
+        dest = 'port',
+        metavar = 'port'
+    )
+
+    parser.add_argument('-lt', '--latency',
+        action = 'store',
+        default = 0.001,
+        type = float,
+        help = 'Delay in seconds before answering each batch of input (default: %(default)s)',
+        dest = 'latency',
+        metavar = 'seconds'
+    )
+
+    options = parser.parse_args()
+    options.log_level_int = getattr(logging, options.log_level, logging.INFO)
+
+def setup_logging():
+
+    global options
+
+    ch = logging.StreamHandler()
+    ch.setLevel(options.log_level_int)
+    ch.setFormatter(logging.Formatter('[{levelname:7}] {name} - {message}', style='{'))
+
+    root = logging.getLogger()
+    root.addHandler(ch)
+    root.setLevel(options.log_level_int)
+
+def main():
+
+    global options
+
+    parse_commandline()
+    setup_logging()
+
+    logger = logging.getLogger('main')
+
+    with StandIn(('localhost', options.port), options.latency) as server:
+        logger.info('Stand-in simh listening on port {port}.'.format(port=options.port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+import os
+import sys
+import shlex
+import logging
+import argparse
+
+import lsttosimh
+
+# Set up argparse and get the command line options.
+def parse_commandline():
+
+    global options
+
+    parser = argparse.ArgumentParser(
+        description = 'Read a simh script of DEPOSIT commands into a memory image and write it as binary or paper tape.',
+    )
+
+    parser.add_argument('-ll', '--log-level',
+        action = 'store',
+        default = 'INFO',
+        help ='Set the logging output level to CRITICAL, ERROR, WARNING, INFO or DEBUG (default: %(default)s)',
+        dest ='log_level',
+        metavar = 'level'
+    )
+
+    parser.add_argument('-if', '--input-file',
+        action = 'store',
+        default = '',
+        help = 'simh script to read, stdin if not given (default: %(default)s)',
+        dest = 'inputfilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-of', '--output-file',
+        action = 'store',
+        default = '',
+        help = 'Output file (default: input file with an extension for the format)',
+        dest = 'outputfilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-f', '--format',
+        action = 'store',
+        default = 'absloader',
+        choices = ['raw', 'absloader', 'simh', 'tape2svg'],
+        help = 'Write a raw binary, an absolute loader tape, a normalized simh script or render the absolute loader tape with tape2svg (default: %(default)s)',
+        dest = 'format',
+        metavar = 'format'
+    )
+
+    parser.add_argument('-to', '--tape2svg-options',
+        action = 'store',
+        default = '',
+        help = 'Extra command line options for tape2svg when format is tape2svg (default: %(default)s)',
+        dest = 'tape2svgoptions',
+        metavar = 'string'
+    )
+
+    options = parser.parse_args()
+    options.log_level_int = getattr(logging, options.log_level, logging.INFO)
+
+    # Create output file name
+    if not options.outputfilename:
+        ext = { 'raw': '.bin', 'absloader': '.ptap', 'simh': '.simh', 'tape2svg': '.svg' }[options.format]
+        if options.inputfilename:
+            (basename, _) = os.path.splitext(options.inputfilename)
+            options.outputfilename = basename + ext
+            if options.outputfilename == options.inputfilename:
+                options.outputfilename += ext
+        else:
+            options.outputfilename = 'output' + ext
+
+def setup_logging():
+
+    global options
+
+    ch = logging.StreamHandler()
+    ch.setLevel(options.log_level_int)
+    ch.setFormatter(logging.Formatter('[{levelname:7}] {name} - {message}', style='{'))
+
+    root = logging.getLogger()
+    root.addHandler(ch)
+    root.setLevel(options.log_level_int)
+
+REGISTERS = { 'R0': 0, 'R1': 1, 'R2': 2, 'R3': 3, 'R4': 4, 'R5': 5, 'R6': 6, 'R7': 7, 'SP': 6, 'PC': 7 }
+
+NOOPERAND = { 'HALT': 0o000000, 'WAIT': 0o000001, 'RTI': 0o000002, 'BPT': 0o000003, 'IOT': 0o000004,
+    'RESET': 0o000005, 'RTT': 0o000006, 'MFPT': 0o000007 }
+
+CONDITIONCODES = { 'NOP': 0o000240, 'CLC': 0o000241, 'CLV': 0o000242, 'CLZ': 0o000244, 'CLN': 0o000250,
+    'CCC': 0o000257, 'SEC': 0o000261, 'SEV': 0o000262, 'SEZ': 0o000264, 'SEN': 0o000270, 'SCC': 0o000277 }
+
+SINGLEOPERAND = { 'JMP': 0o000100, 'SWAB': 0o000300, 'CLR': 0o005000, 'COM': 0o005100, 'INC': 0o005200,
+    'DEC': 0o005300, 'NEG': 0o005400, 'ADC': 0o005500, 'SBC': 0o005600, 'TST': 0o005700, 'ROR': 0o006000,
+    'ROL': 0o006100, 'ASR': 0o006200, 'ASL': 0o006300, 'MFPI': 0o006500, 'MTPI': 0o006600, 'SXT': 0o006700,
+    'CLRB': 0o105000, 'COMB': 0o105100, 'INCB': 0o105200, 'DECB': 0o105300, 'NEGB': 0o105400,
+    'ADCB': 0o105500, 'SBCB': 0o105600, 'TSTB': 0o105700, 'RORB': 0o106000, 'ROLB': 0o106100,
+    'ASRB': 0o106200, 'ASLB': 0o106300, 'MTPS': 0o106400, 'MFPD': 0o106500, 'MTPD': 0o106600,
+    'MFPS': 0o106700 }
+
+DOUBLEOPERAND = { 'MOV': 0o010000, 'CMP': 0o020000, 'BIT': 0o030000, 'BIC': 0o040000, 'BIS': 0o050000,
+    'ADD': 0o060000, 'MOVB': 0o110000, 'CMPB': 0o120000, 'BITB': 0o130000, 'BICB': 0o140000,
+    'BISB': 0o150000, 'SUB': 0o160000 }
+
+# Register first, then an operand: JSR R,dst and XOR R,dst
+REGISTERDESTINATION = { 'JSR': 0o004000, 'XOR': 0o074000 }
+
+# Operand first, then a register: MUL src,R and friends
+REGISTERSOURCE = { 'MUL': 0o070000, 'DIV': 0o071000, 'ASH': 0o072000, 'ASHC': 0o073000 }
+
+BRANCH = { 'BR': 0o000400, 'BNE': 0o001000, 'BEQ': 0o001400, 'BGE': 0o002000, 'BLT': 0o002400,
+    'BGT': 0o003000, 'BLE': 0o003400, 'BPL': 0o100000, 'BMI': 0o100400, 'BHI': 0o101000,
+    'BLOS': 0o101400, 'BVC': 0o102000, 'BVS': 0o102400, 'BCC': 0o103000, 'BHIS': 0o103000,
+    'BCS': 0o103400, 'BLO': 0o103400 }
+
+# Instructions with a literal operand field and its maximum value.
+LITERAL = { 'EMT': (0o104000, 0o377), 'TRAP': (0o104400, 0o377), 'SPL': (0o000230, 0o7), 'MARK': (0o006400, 0o77) }
+
+# Octal number, or decimal with a trailing dot, optionally negative. Returns a 16-bit word.
+def parsenumber(text):
+
+    text = text.strip()
+    negative = text.startswith('-')
+    if negative:
+        text = text[1:]
+
+    if text.endswith('.'):
+        value = int(text[:-1], 10)
+    else:
+        value = int(text, 8)
+
+    return (-value if negative else value) & 0o177777
+
+def parseregister(text):
+
+    text = text.strip()
+    if not text in REGISTERS:
+        raise ValueError('Register ''{text}'' not supported.'.format(text=text))
+
+    return REGISTERS[text]
+
+# Parse an operand in the syntax simh accepts. Returns mode, register and the
+# extra word as None, ('abs', value) or ('rel', target address).
+def parseoperand(text):
+
+    text = text.strip()
+    deferred = text.startswith('@')
+    if deferred:
+        text = text[1:]
+
+    if text in REGISTERS:
+        return (1 if deferred else 0, REGISTERS[text], None)
+
+    if text.startswith('#'):
+        return (3 if deferred else 2, 7, ('abs', parsenumber(text[1:])))
+
+    if text.startswith('-(') and text.endswith(')'):
+        return (5 if deferred else 4, parseregister(text[2:-1]), None)
+
+    if text.startswith('(') and text.endswith(')+'):
+        return (3 if deferred else 2, parseregister(text[1:-2]), None)
+
+    if text.startswith('(') and text.endswith(')'):
+        if deferred:
+            return (7, parseregister(text[1:-1]), ('abs', 0))
+        return (1, parseregister(text[1:-1]), None)
+
+    if text.endswith(')') and ('(' in text):
+        (index, register) = text[:-1].split('(', 1)
+        return (7 if deferred else 6, parseregister(register), ('abs', parsenumber(index)))
+
+    # A bare address is PC relative.
+    return (7 if deferred else 6, 7, ('rel', parsenumber(text)))
+
+# Turn a branch target into the 8-bit word offset from the updated PC.
+def branchoffset(addr, target):
+
+    offset = (target - addr - 2) & 0o177777
+    if offset & 0o100000:
+        offset -= 0o200000
+
+    if (offset & 1) or not (-256 <= offset <= 254):
+        raise ValueError('Branch target {target:o} out of reach from {addr:o}.'.format(target=target, addr=addr))
+
+    return (offset >> 1) & 0o377
+
+# Assemble one instruction in simh symbolic syntax at addr. Returns the list of
+# words, the instruction followed by the extra words for its operands.
+def assemble(addr, text):
+
+    text = text.upper()
+    parts = text.split(None, 1)
+    mnemonic = parts[0]
+    operands = [o.strip() for o in parts[1].split(',')] if len(parts) > 1 else []
+
+    words = [0]
+
+    def operand(spec):
+        (mode, register, extra) = parseoperand(spec)
+        if extra:
+            (kind, value) = extra
+            if kind == 'rel':
+                # Relative to the PC after the extra word has been fetched.
+                value = (value - (addr + 2 * len(words) + 2)) & 0o177777
+            words.append(value)
+        return (mode << 3) | register
+
+    def expect(n):
+        if len(operands) != n:
+            raise ValueError('Instruction ''{mnemonic}'' takes {n} operand{s}.'.format(mnemonic=mnemonic, n=n, s='' if n == 1 else 's'))
+
+    if mnemonic in NOOPERAND:
+        expect(0)
+        words[0] = NOOPERAND[mnemonic]
+
+    elif mnemonic in CONDITIONCODES:
+        # Condition code operators combine, like SEZ SEV.
+        for cc in text.split():
+            if not cc in CONDITIONCODES:
+                raise ValueError('Cannot combine ''{cc}'' with condition codes.'.format(cc=cc))
+            words[0] |= CONDITIONCODES[cc]
+
+    elif mnemonic in SINGLEOPERAND:
+        expect(1)
+        words[0] = SINGLEOPERAND[mnemonic] | operand(operands[0])
+
+    elif mnemonic in DOUBLEOPERAND:
+        expect(2)
+        source = operand(operands[0])
+        words[0] = DOUBLEOPERAND[mnemonic] | (source << 6) | operand(operands[1])
+
+    elif mnemonic in REGISTERDESTINATION:
+        expect(2)
+        words[0] = REGISTERDESTINATION[mnemonic] | (parseregister(operands[0]) << 6) | operand(operands[1])
+
+    elif mnemonic in REGISTERSOURCE:
+        expect(2)
+        source = operand(operands[0])
+        words[0] = REGISTERSOURCE[mnemonic] | (parseregister(operands[1]) << 6) | source
+
+    elif mnemonic in BRANCH:
+        expect(1)
+        words[0] = BRANCH[mnemonic] | branchoffset(addr, parsenumber(operands[0]))
+
+    elif mnemonic == 'SOB':
+        expect(2)
+        offset = (addr + 2 - parsenumber(operands[1])) & 0o177777
+        if (offset & 1) or (offset > 0o176):
+            raise ValueError('SOB target {target} out of reach from {addr:o}.'.format(target=operands[1], addr=addr))
+        words[0] = 0o077000 | (parseregister(operands[0]) << 6) | (offset >> 1)
+
+    elif mnemonic == 'RTS':
+        expect(1)
+        words[0] = 0o000200 | parseregister(operands[0])
+
+    elif mnemonic in LITERAL:
+        (opcode, maximum) = LITERAL[mnemonic]
+        value = parsenumber(operands[0]) if operands else 0
+        if value > maximum:
+            raise ValueError('Operand {value:o} too large for ''{mnemonic}''.'.format(mnemonic=mnemonic, value=value))
+        words[0] = opcode | value
+
+    else:
+        raise ValueError('Instruction ''{mnemonic}'' not supported.'.format(mnemonic=mnemonic))
+
+    return words
+
+# Read a simh script into the memory image. Memory deposits go into image,
+# register deposits into registers. GO and RUN set registers['PC'] too. DO
+# commands are followed relative to the directory of the script.
+def readscript(lines, image, registers, directory='.'):
+
+    deposits = 0
+
+    for (lineno, line) in enumerate(lines, 1):
+        line = line.split(';', 1)[0].strip()
+        if not line:
+            continue
+
+        try:
+            parts = line.split(None, 1)
+            command = parts[0].upper()
+            arguments = parts[1] if len(parts) > 1 else ''
+
+            if command in ('GO', 'RUN'):
+                if arguments:
+                    registers['PC'] = parsenumber(arguments.split()[0])
+
+            elif command == 'DO':
+                filename = os.path.join(directory, arguments.split()[0])
+                with open(filename, 'r') as scriptfile:
+                    deposits += readscript(scriptfile, image, registers, os.path.dirname(filename))
+
+            elif 'DEPOSIT'.startswith(command):
+                # Switches come first, -b deposits bytes.
+                bytemode = False
+                parts = arguments.split(None, 1)
+                while parts and parts[0].startswith('-'):
+                    bytemode = bytemode or ('B' in parts[0].upper())
+                    parts = parts[1].split(None, 1) if len(parts) > 1 else []
+                if len(parts) < 2:
+                    raise ValueError('DEPOSIT needs an address and a value.')
+                (target, value) = parts
+
+                if not target[0].isdigit():
+                    registers[target.upper()] = parsenumber(value)
+                    continue
+
+                # Ranges deposit the same value at every location.
+                (first, _, last) = target.replace(':', '-').partition('-')
+                addr = int(first, 8)
+                last = int(last, 8) if last else addr
+
+                while addr <= last:
+                    if bytemode:
+                        word = addr & ~1
+                        byte = parsenumber(value) & 0o377
+                        if addr & 1:
+                            image[word] = (image.get(word, 0) & 0o377) | (byte << 8)
+                        else:
+                            image[word] = (image.get(word, 0) & 0o177400) | byte
+                        addr += 1
+                    else:
+                        try:
+                            words = [parsenumber(value)]
+                        except ValueError:
+                            words = assemble(addr, value)
+                        for word in words:
+                            image[addr] = word
+                            addr += 2
+                    deposits += 1
+
+        except ValueError as e:
+            raise ValueError('Line {lineno}: {error} ({line})'.format(lineno=lineno, error=e, line=line))
+
+    return deposits
+
+def main():
+
+    global options
+
+    parse_commandline()
+    setup_logging()
+
+    logger = logging.getLogger('main')
+
+    try:
+        image = {}
+        registers = {}
+        if options.inputfilename:
+            with open(options.inputfilename, 'r') as inputfile:
+                deposits = readscript(inputfile, image, registers, os.path.dirname(options.inputfilename))
+        else:
+            deposits = readscript(sys.stdin, image, registers)
+
+        logger.info('{deposits} deposits, {words} words of memory.'.format(deposits=deposits, words=len(image)))
+
+        if options.format == 'raw':
+            (base, data) = lsttosimh.rawbytes(image)
+            with open(options.outputfilename, 'wb') as outputfile:
+                outputfile.write(data)
+            logger.info('Wrote {n} bytes from address {base:06o} to {outputfilename}.'.format(n=len(data), base=base, outputfilename=options.outputfilename))
+
+        elif options.format == 'simh':
+            with open(options.outputfilename, 'w') as outputfile:
+                lsttosimh.writeimage(image, outputfile)
+            logger.info('Wrote {outputfilename}.'.format(outputfilename=options.outputfilename))
+
+        elif options.format == 'absloader':
+            lsttosimh.checkabsloader(image)
+
+            # Start at the PC the script leaves behind, halt after loading if there is none.
+            data = bytes(lsttosimh.absloader(image, registers.get('PC', 1)))
+            with open(options.outputfilename, 'wb') as outputfile:
+                outputfile.write(data)
+            logger.info('Wrote {n} bytes of absolute loader tape to {outputfilename}.'.format(n=len(data), outputfilename=options.outputfilename))
+
+        else:
+            import lsttotape
+            lsttotape.punchimage(image, registers.get('PC', 1), ['-of', options.outputfilename] + shlex.split(options.tape2svgoptions))
+
+    except ValueError as e:
+        logger.error(e)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
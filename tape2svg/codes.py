@@ -0,0 +1,204 @@
+import re
+import collections
+
+# How the holes are laid out across a tape: its width in inches, the number of
+# channels and how many of them are right of the feed hole. Five level tape
+# has two channels on that side and three on the other. Seven bit codes were
+# punched on eight level tape, with the eighth channel blank or for parity.
+Layout = collections.namedtuple('Layout', 'width channels feedafter')
+
+LAYOUTS = {
+    5: Layout(11/16, 5, 2),
+    7: Layout(1.0, 8, 3),
+    8: Layout(1.0, 8, 3)
+}
+
+# Distance of the channels from the left edge of the tape, bit 0 first, and of
+# the feed hole. Holes are 0.1in apart and centered across the tape.
+def holepositions(bitcount):
+
+    layout = LAYOUTS[bitcount]
+
+    positions = []
+    feed = None
+
+    cx = (layout.width + layout.channels * 0.1) / 2 # Least significant bit on the right
+    for channel in range(layout.channels):
+        positions.append(cx)
+        cx -= 0.1
+
+        if channel == layout.feedafter - 1:
+            feed = cx
+            cx -= 0.1
+
+    return (positions[:bitcount], feed)
+
+ENCODINGS = ('binary', 'ascii', 'ita2')
+PARITIES = ('none', 'even', 'odd', 'mark', 'space')
+
+# Number of bits in the codes, the parity bit comes on top.
+def codewidth(encoding, paritykind, bitcount):
+
+    if encoding == 'ascii':
+        return 7
+    elif encoding == 'ita2':
+        return 5
+    else:
+        return bitcount - 1 if paritykind != 'none' else bitcount
+
+# ITA2 by code, for the letter and for the figure shift. The codes without a
+# character of their own are None.
+ITA2LETTERS = [
+    '\0', 'E', '\n', 'A', ' ', 'S', 'I', 'U', '\r', 'D', 'R', 'J', 'N', 'F', 'C', 'K',
+    'T', 'Z', 'L', 'W', 'H', 'Y', 'P', 'Q', 'O', 'B', 'G', None, 'M', 'X', 'V', None
+]
+
+ITA2FIGURES = [
+    '\0', '3', '\n', '-', ' ', '\'', '8', '7', '\r', '\x05', '4', '\x07', ',', None, ':', '(',
+    '5', '+', ')', '2', None, '6', '0', '1', '9', '?', None, None, '.', '/', '=', None
+]
+
+FIGS = 0x1b
+LTRS = 0x1f
+
+# Characters that are the same in both shifts and need none.
+ITA2COMMON = '\0\n\r '
+
+# Tables for bytes.translate() from characters to codes and back.
+def translatetable(codes, invert):
+
+    table = bytearray(b'?' * 256) if invert else bytearray(256)
+    for (code, char) in enumerate(codes):
+        if char is not None:
+            if invert:
+                table[code] = ord(char)
+            else:
+                table[ord(char)] = code
+
+    return bytes(table)
+
+ITA2LETTERSTABLE = translatetable(ITA2LETTERS, False)
+ITA2FIGURESTABLE = translatetable(ITA2FIGURES, False)
+ITA2LETTERSTEXT = translatetable(ITA2LETTERS, True)
+ITA2FIGURESTEXT = translatetable(ITA2FIGURES, True)
+
+def charclass(chars):
+    return re.escape(''.join(sorted(chars)).encode('ascii'))
+
+# Text falls into runs that can be translated in one go. A run of letters or of
+# figures takes the common characters after it along, as they need no shift.
+ITA2RUN = re.compile(rb'(?P<letters>[%(l)s][%(l)s%(c)s]*)|(?P<figures>[%(f)s][%(f)s%(c)s]*)|(?P<common>[%(c)s]+)|(?P<other>.)' % {
+    b'l': charclass(set(c for c in ITA2LETTERS if c) - set(ITA2COMMON)),
+    b'f': charclass(set(c for c in ITA2FIGURES if c) - set(ITA2COMMON)),
+    b'c': charclass(ITA2COMMON)
+}, re.DOTALL)
+
+# Text as ITA2 codes, with a shift whenever the next run needs the other one.
+def encodeita2(text):
+
+    codes = bytearray()
+    shift = None
+
+    for match in ITA2RUN.finditer(text.upper()):
+        run = match.group()
+
+        if match.lastgroup == 'other':
+            raise ValueError('Character {char!r} at offset {offset} has no ITA2 code.'.format(char = chr(run[0]), offset = match.start()))
+
+        if match.lastgroup == 'figures':
+            if shift != FIGS:
+                codes.append(FIGS)
+                shift = FIGS
+            codes += run.translate(ITA2FIGURESTABLE)
+        else:
+            if (match.lastgroup == 'letters') and (shift != LTRS):
+                codes.append(LTRS)
+                shift = LTRS
+            codes += run.translate(ITA2LETTERSTABLE)
+
+    return bytes(codes)
+
+# ITA2 codes back to text, the shifts taken out.
+def decodeita2(codes):
+
+    text = bytearray()
+    table = ITA2LETTERSTEXT
+
+    for run in re.split(rb'([\x1b\x1f])', codes.translate(masktable(5))):
+        if run == bytes([FIGS]):
+            table = ITA2FIGURESTEXT
+        elif run == bytes([LTRS]):
+            table = ITA2LETTERSTEXT
+        else:
+            text += run.translate(table)
+
+    return bytes(text)
+
+def parity(code, kind):
+
+    ones = bin(code).count('1') & 1
+
+    return { 'even': ones, 'odd': ones ^ 1, 'mark': 1, 'space': 0 }[kind]
+
+# Table for bytes.translate() that sets the parity bit above the code.
+def paritytable(kind, width):
+
+    return bytes(((code | parity(code, kind) << width) & 0xff) for code in range(256))
+
+# Table for bytes.translate() that keeps only the code bits of the rows.
+def masktable(width):
+
+    return bytes((row & ((1 << width) - 1)) for row in range(256))
+
+# Table for bytes.translate() that marks rows with bad parity with a one.
+def paritychecktable(kind, width):
+
+    table = paritytable(kind, width)
+
+    return bytes(int(table[row & ((1 << width) - 1)] != row) for row in range(256))
+
+# Make sure all bytes fit into the code.
+def checkwidth(data, width, what):
+
+    # Deleting all codes that fit leaves only the ones that do not.
+    if (width < 8) and bytes(data).translate(None, bytes(range(1 << width))):
+        offset = next(i for (i, byte) in enumerate(data) if byte >> width)
+        raise ValueError('{what} at offset {offset} is {byte:#04x}, more than {width} bits.'.format(
+            what = what,
+            offset = offset,
+            byte = data[offset],
+            width = width
+        ))
+
+# Data bytes as the rows to punch for the encoding and parity. Everything is
+# translated with tables in bulk, never byte by byte.
+def encode(data, encoding='binary', paritykind='none', bitcount=8):
+
+    width = codewidth(encoding, paritykind, bitcount)
+
+    if encoding == 'ita2':
+        rows = encodeita2(bytes(data))
+    else:
+        rows = bytes(data)
+        checkwidth(rows, width, 'ASCII character' if encoding == 'ascii' else 'Byte')
+
+    if paritykind != 'none':
+        rows = rows.translate(paritytable(paritykind, width))
+
+    return rows
+
+# The rows read from a tape back into data bytes. Returns the data and the
+# number of rows with bad parity.
+def decode(rows, encoding='binary', paritykind='none', bitcount=8):
+
+    width = codewidth(encoding, paritykind, bitcount)
+
+    badparity = 0
+    if paritykind != 'none':
+        badparity = bytes(rows).translate(paritychecktable(paritykind, width)).count(1)
+        rows = bytes(rows).translate(masktable(width))
+
+    if encoding == 'ita2':
+        return (decodeita2(bytes(rows)), badparity)
+
+    return (bytes(rows), badparity)
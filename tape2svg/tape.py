@@ -0,0 +1,47 @@
+import zlib
+import collections
+
+# A stretch of tape made for one purpose, like the lead-in or the data.
+Segment = collections.namedtuple('Segment', 'name start length')
+
+# A paper tape as data: one byte per row of holes with bit 0 for the channel
+# at the right edge, and the segments the rows make up. The length and the
+# CRC-32 are kept up to date as segments are added, so they are there without
+# reading the rows again.
+#
+# Views into the rows are memoryviews and copy nothing. The rows cannot grow
+# while a view is held, so build the tape first and look at it afterwards.
+class Tape:
+
+    def __init__(self, bitcount=8):
+
+        self.bitcount = bitcount
+        self.rows = bytearray()
+        self.segments = []
+        self.crc = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Add a segment. The rows can be bytes or any iterable of ints.
+    def append(self, name, rows):
+
+        if not isinstance(rows, (bytes, bytearray, memoryview)):
+            rows = bytes(rows)
+
+        if (self.bitcount < 8) and bytes(rows).translate(None, bytes(range(1 << self.bitcount))):
+            raise ValueError('Rows of the {name} need more than {bitcount} channels.'.format(name=name, bitcount=self.bitcount))
+
+        self.segments.append(Segment(name, len(self.rows), len(rows)))
+        self.rows += rows
+        self.crc = zlib.crc32(rows, self.crc)
+
+    def view(self, start=0, stop=None):
+        return memoryview(self.rows)[start:stop]
+
+    def segmentview(self, segment):
+        return self.view(segment.start, segment.start + segment.length)
+
+    # The rows of all segments of that name, one after the other.
+    def segmentrows(self, name):
+        return b''.join(self.segmentview(segment) for segment in self.segments if segment.name == name)
@@ -0,0 +1,519 @@
+import os
+import re
+import sys
+import gzip
+import logging
+import argparse
+import itertools
+import xml.etree.ElementTree as ET
+
+import tape
+import codes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Set up argparse and get the command line options.
+def parse_commandline():
+
+    global options
+
+    parser = argparse.ArgumentParser(
+        description = 'Read the bytes back from tapes rendered by tape2svg, as SVG or as a scanned image.',
+    )
+
+    parser.add_argument('-ll', '--log-level',
+        action = 'store',
+        default = 'INFO',
+        help ='Set the logging output level to CRITICAL, ERROR, WARNING, INFO or DEBUG (default: %(default)s)',
+        dest ='log_level',
+        metavar = 'level'
+    )
+
+    parser.add_argument('-if', '--input-file',
+        action = 'store',
+        required = True,
+        help = 'First page of the tape. For SVG the pages with a numerical suffix are read as well, for scans list all pages separated by commas',
+        dest = 'inputfilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-of', '--output-file',
+        action = 'store',
+        default = '',
+        help = 'When given write the decoded data bytes there (default: %(default)s)',
+        dest = 'outputfilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-cf', '--compare-file',
+        action = 'store',
+        default = '',
+        help = 'When given compare the decoded data bytes against this file (default: %(default)s)',
+        dest = 'comparefilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-ar', '--all-rows',
+        action = 'store',
+        default = False,
+        type = str2bool,
+        help = 'Decode every row including lead-in, title and lead-out instead of only the data (default: %(default)s)',
+        dest = 'allrows',
+        metavar = 'flag'
+    )
+
+    parser.add_argument('-bc', '--bit-count',
+        action = 'store',
+        default = 8,
+        type = int,
+        choices = sorted(codes.LAYOUTS),
+        help = 'How many bits in the tape, as given to tape2svg (default: %(default)s)',
+        dest = 'bitcount',
+        metavar = 'num'
+    )
+
+    parser.add_argument('-en', '--encoding',
+        action = 'store',
+        default = 'binary',
+        choices = codes.ENCODINGS,
+        help = 'How the data was punched, as given to tape2svg. The data is decoded back from it (default: %(default)s)',
+        dest = 'encoding',
+        metavar = 'encoding'
+    )
+
+    parser.add_argument('-pa', '--parity',
+        action = 'store',
+        default = 'none',
+        choices = codes.PARITIES,
+        help = 'Parity bit punched above the code, as given to tape2svg. It is checked and taken off (default: %(default)s)',
+        dest = 'parity',
+        metavar = 'parity'
+    )
+
+    parser.add_argument('-sr', '--skip-rows',
+        action = 'store',
+        default = 10,
+        type = int,
+        help = 'For scans: rows of lead-in and title before the data, scans do not tell (default: %(default)s)',
+        dest = 'skiprows',
+        metavar = 'num'
+    )
+
+    parser.add_argument('-hc', '--hole-color',
+        action = 'store',
+        default = 'white',
+        help = 'For SVG: the hole color the tape was rendered with (default: %(default)s)',
+        dest = 'holecolor',
+        metavar = 'html-color'
+    )
+
+    parser.add_argument('-dpi', '--dpi',
+        action = 'store',
+        default = 300,
+        type = float,
+        help = 'For scans: resolution of the scan (default: %(default)s)',
+        dest = 'dpi',
+        metavar = 'num'
+    )
+
+    parser.add_argument('-th', '--threshold',
+        action = 'store',
+        default = 0.9,
+        type = float,
+        help = 'For scans: brightness between 0 and 1 above which a pixel counts as hole or paper rather than tape (default: %(default)s)',
+        dest = 'threshold',
+        metavar = 'num'
+    )
+
+    options = parser.parse_args()
+    options.log_level_int = getattr(logging, options.log_level, logging.INFO)
+
+    options.layout = codes.LAYOUTS[options.bitcount]
+
+# Conversion function for argparse booleans
+def str2bool(v):
+    if v.lower() in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v.lower() in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError('Boolean value expected.')
+
+def setup_logging():
+
+    global options
+
+    ch = logging.StreamHandler()
+    ch.setLevel(options.log_level_int)
+    ch.setFormatter(logging.Formatter('[{levelname:7}] {name} - {message}', style='{'))
+
+    root = logging.getLogger()
+    root.addHandler(ch)
+    root.setLevel(options.log_level_int)
+
+# Find the page files tape2svg wrote for the first one: name.svg, name.1.svg, ...
+def pagefilenames(filename):
+
+    (basename, ext) = os.path.splitext(filename)
+
+    pages = [filename]
+    n = 1
+    while os.path.exists(basename + '.' + str(n) + ext):
+        pages.append(basename + '.' + str(n) + ext)
+        n += 1
+
+    return pages
+
+def openpage(filename):
+
+    with open(filename, 'rb') as f:
+        magic = f.read(2)
+
+    if magic == b'\x1f\x8b':
+        return gzip.open(filename, 'rb')
+
+    return open(filename, 'rb')
+
+def inches(value):
+    return float(value[:-2]) if value.endswith('in') else float(value) / 96
+
+FEEDHOLE = 0.023
+
+# Which bit a data hole stands for, from its distance to the feed hole in
+# rows of 0.1in. On eight level tape bits 0-2 are right of the feed hole, 3-7
+# left of it, on five level tape bits 0-1 and 2-4.
+def bitfromoffset(offset):
+
+    steps = round(offset / 0.1)
+    feedafter = options.layout.feedafter
+    return feedafter - steps if steps > 0 else feedafter - 1 - steps
+
+# Holes of one row collected while streaming.
+class Row:
+
+    def __init__(self, cx, cy):
+        self.cx = cx
+        self.cy = cy
+        self.feed = None
+        self.data = []
+
+    # Does a hole at cx, cy still belong to this row? Neighbouring columns are
+    # a tape width apart and the next column starts at the top again.
+    def has(self, cx, cy):
+        return (abs(cy - self.cy) < 0.01) and (abs(cx - self.cx) < 0.9)
+
+    def byte(self):
+
+        if self.feed is None:
+            raise ValueError('Row at {cx:.3f}in, {cy:.3f}in has no feed hole.'.format(cx=self.cx, cy=self.cy))
+
+        byte = 0
+        for cx in self.data:
+            byte |= 1 << bitfromoffset(cx - self.feed)
+
+        return byte
+
+# Rows of one byte drawn as a rectangle filled with the pattern for the byte by
+# tape2svg -rl.
+RUNFILL = re.compile(r'^url\(#row-([0-9a-f]{2})\)$')
+
+# Holes drawn as circles in a path by tape2svg -hp, in inches.
+HOLESUBPATH = re.compile(r'M([-\d.]+),([-\d.]+)a([\d.]+),')
+
+# Stream the rows of one SVG page. Yields (byte, indata) for each row, indata
+# telling whether the row lies between the data comments tape2svg writes. The
+# data often spans pages, so the state at the start of the page is passed in.
+def decodesvgpage(filename, indata=False):
+
+    parser = ET.XMLPullParser(events=('start', 'end', 'comment'))
+
+    row = None
+
+    # The circles inside the run patterns are not holes on the tape.
+    inpattern = False
+
+    # Holes from paths come per column, data holes before feed holes, and are
+    # sorted into rows once the column is complete.
+    pathrows = {}
+
+    def flush():
+        nonlocal row
+        results = []
+        if row:
+            results.append((row.byte(), indata))
+            row = None
+        for cy in sorted(pathrows):
+            results.append((pathrows[cy].byte(), indata))
+        pathrows.clear()
+        return results
+
+    with openpage(filename) as page:
+        while True:
+            chunk = page.read(1 << 16)
+            if not chunk:
+                break
+
+            parser.feed(chunk)
+            for (event, element) in parser.read_events():
+
+                if event == 'comment':
+                    # Rows and columns are complete at every comment.
+                    yield from flush()
+
+                    text = element.text.strip()
+                    if re.match(r'^\d+ bytes of data$', text):
+                        indata = True
+                    elif text == 'End of data':
+                        indata = False
+                    continue
+
+                tag = element.tag.rsplit('}', 1)[-1]
+                if tag == 'pattern':
+                    inpattern = (event == 'start')
+                    continue
+                if event == 'start' or inpattern:
+                    continue
+
+                if tag == 'rect' and RUNFILL.match(element.get('fill', '')):
+                    yield from flush()
+
+                    data = int(RUNFILL.match(element.get('fill')).group(1), 16)
+                    for _ in range(int(round(float(element.get('height')) / 0.1))):
+                        yield (data, indata)
+
+                elif tag == 'circle':
+                    # Unpunched positions are drawn in tape color when not only holes are rendered.
+                    if element.get('fill') == options.holecolor:
+                        cx = inches(element.get('cx'))
+                        cy = inches(element.get('cy'))
+                        r = inches(element.get('r'))
+
+                        if not (row and row.has(cx, cy)):
+                            yield from flush()
+                            row = Row(cx, cy)
+
+                        if abs(r - FEEDHOLE) < 0.001:
+                            row.feed = cx
+                        else:
+                            row.data.append(cx)
+
+                elif tag == 'path':
+                    if element.get('fill') == options.holecolor:
+                        for match in HOLESUBPATH.finditer(element.get('d', '')):
+                            r = float(match.group(3))
+                            cx = float(match.group(1)) + r
+                            cy = float(match.group(2))
+
+                            key = round(cy * 100)
+                            if key not in pathrows:
+                                pathrows[key] = Row(cx, cy)
+
+                            if abs(r - FEEDHOLE) < 0.001:
+                                pathrows[key].feed = cx
+                            else:
+                                pathrows[key].data.append(cx)
+
+                # Keep memory bounded however long the page is.
+                element.clear()
+
+    yield from flush()
+
+# Read a scanned page into a 2D array of brightness from 0 to 1. PGM and PPM
+# are read directly, other formats need Pillow.
+def readraster(filename):
+
+    with open(filename, 'rb') as f:
+        header = f.read(2)
+
+    if header in (b'P5', b'P6'):
+        with open(filename, 'rb') as f:
+            data = f.read()
+
+        # Header: magic, width, height, maxval, separated by whitespace and comments.
+        fields = []
+        offset = 2
+        while len(fields) < 3:
+            while data[offset:offset + 1].isspace():
+                offset += 1
+            if data[offset:offset + 1] == b'#':
+                offset = data.index(b'\n', offset)
+                continue
+            end = offset
+            while not data[end:end + 1].isspace():
+                end += 1
+            fields.append(int(data[offset:end]))
+            offset = end
+        offset += 1
+
+        (width, height, maxval) = fields
+        channels = 3 if header == b'P6' else 1
+        pixels = numpy.frombuffer(data, dtype=numpy.uint8 if maxval < 256 else '>u2', count=width * height * channels, offset=offset)
+        pixels = pixels.reshape(height, width, channels).mean(axis=2)
+
+        return pixels / maxval
+
+    from PIL import Image
+    with Image.open(filename) as image:
+        return numpy.asarray(image.convert('L'), dtype=numpy.float32) / 255
+
+# Runs of True in a 1D boolean array as (start, end) pairs.
+def runs(mask):
+
+    edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], mask.astype(numpy.int8), [0]))))
+    return edges.reshape(-1, 2)
+
+# Find the tape columns of a scanned page and yield the byte of each row, right
+# column first and top to bottom, like tape2svg lays them out.
+def decoderasterpage(gray, dpi, threshold, bitcount=8):
+
+    # Distance of the data holes and the feed holes from the right tape edge in
+    # inches.
+    tapewidth = codes.LAYOUTS[bitcount].width
+    (positions, feed) = codes.holepositions(bitcount)
+    bitoffsets = [tapewidth - cx for cx in positions]
+
+    logger = logging.getLogger('main')
+
+    tape = gray < threshold
+    hole = ~tape
+
+    # Tape columns are stripes of pixel columns that are mostly tape.
+    columns = [(x0, x1) for (x0, x1) in runs(tape.mean(axis=0) > 0.3) if abs((x1 - x0) - tapewidth * dpi) < 0.2 * dpi]
+    logger.debug('{n} tape columns found.'.format(n=len(columns)))
+
+    for (x0, x1) in reversed(columns):
+        # The right edge is the reference for the hole positions.
+        def at(offset):
+            return int(round(x1 - offset * dpi))
+
+        # The tape section is where the hole-free strip along the edge is tape.
+        edge = tape[:, at(0.03)]
+        sections = runs(edge)
+        if not len(sections):
+            continue
+        (y0, y1) = max(sections, key=lambda s: s[1] - s[0])
+
+        # Each row has a feed hole, find their centers along the feed track.
+        feedx = at(tapewidth - feed)
+        track = hole[y0:y1, feedx - 1:feedx + 2].all(axis=1)
+        feeds = [(a + b) // 2 + y0 for (a, b) in runs(track) if (b - a) < 0.07 * dpi]
+        if not feeds:
+            continue
+
+        ys = numpy.array(feeds)
+
+        # Sample a small box around each possible data hole of each row.
+        box = max(1, int(0.01 * dpi))
+        bits = numpy.zeros(len(ys), dtype=numpy.uint8)
+        for (bit, offset) in enumerate(bitoffsets):
+            x = at(offset)
+            patch = numpy.stack([hole[ys + dy, x - box:x + box + 1] for dy in range(-box, box + 1)])
+            bits |= (patch.mean(axis=(0, 2)) > 0.5).astype(numpy.uint8) << bit
+
+        yield from bits.tolist()
+
+# Read the tape back into its rows, with the rows that hold the data in
+# segments of their own.
+def decode():
+
+    logger = logging.getLogger('main')
+
+    decoded = tape.Tape()
+
+    if os.path.splitext(options.inputfilename)[1].lower() in ('.svg', '.svgz'):
+        indata = False
+        for pagefilename in pagefilenames(options.inputfilename):
+            logger.debug('Decoding {pagefilename}.'.format(pagefilename=pagefilename))
+            for (indata, rows) in itertools.groupby(decodesvgpage(pagefilename, indata), key=lambda row: row[1]):
+                decoded.append('data' if indata else 'leader', bytes(byte for (byte, _) in rows))
+
+    else:
+        if numpy is None:
+            raise ValueError('Decoding scans needs numpy.')
+
+        rows = bytearray()
+        for pagefilename in options.inputfilename.split(','):
+            logger.debug('Decoding {pagefilename}.'.format(pagefilename=pagefilename))
+            rows += bytes(decoderasterpage(readraster(pagefilename), options.dpi, options.threshold, options.bitcount))
+        decoded.append('leader', rows[:options.skiprows])
+        decoded.append('data', rows[options.skiprows:])
+
+    logger.info('{rows} rows decoded, CRC-32 {crc:08x}.'.format(rows=len(decoded), crc=decoded.crc))
+
+    return decoded
+
+# Write the data rows of the tape, or all rows, to the output file and compare
+# them with the source. Returns the number of bytes and of differences. The
+# tape is in memory as a whole already, so is the source.
+def verify(decoded):
+
+    logger = logging.getLogger('main')
+
+    if options.allrows:
+        data = decoded.view()
+    else:
+        (data, badparity) = codes.decode(decoded.segmentrows('data'), options.encoding, options.parity, options.bitcount)
+        if badparity:
+            logger.warning('{n} row{s} with bad {parity} parity.'.format(n=badparity, s='' if badparity == 1 else 's', parity=options.parity))
+
+    if options.outputfilename:
+        with open(options.outputfilename, 'wb') as outputfile:
+            outputfile.write(data)
+
+    differences = 0
+    if options.comparefilename:
+        with open(options.comparefilename, 'rb') as comparefile:
+            differences = compare(data, comparefile.read())
+
+    return (len(data), differences)
+
+# Count the bytes that differ, the first few are logged.
+def compare(data, expected):
+
+    logger = logging.getLogger('main')
+
+    if data == expected:
+        return 0
+
+    differences = 0
+    for (offset, (a, b)) in enumerate(zip(data, expected)):
+        if a != b:
+            if differences < 10:
+                logger.warning('Offset {offset}: tape has {a:#04x}, source has {b:#04x}.'.format(offset=offset, a=a, b=b))
+            differences += 1
+
+    if len(data) > len(expected):
+        logger.warning('Tape is {n} bytes longer than {comparefilename}.'.format(n=len(data) - len(expected), comparefilename=options.comparefilename))
+    elif len(data) < len(expected):
+        logger.warning('Tape is {n} bytes shorter than {comparefilename}.'.format(n=len(expected) - len(data), comparefilename=options.comparefilename))
+
+    return differences + abs(len(data) - len(expected))
+
+def main():
+
+    global options
+
+    parse_commandline()
+    setup_logging()
+
+    logger = logging.getLogger('main')
+
+    try:
+        (count, differences) = verify(decode())
+    except (ValueError, ET.ParseError, OSError) as e:
+        logger.error(e)
+        sys.exit(2)
+
+    logger.info('{count} bytes of data decoded.'.format(count=count))
+
+    if options.comparefilename:
+        if differences:
+            logger.error('{differences} difference{s} to {comparefilename}.'.format(differences=differences, s='' if differences == 1 else 's', comparefilename=options.comparefilename))
+            sys.exit(1)
+        logger.info('Tape matches {comparefilename}.'.format(comparefilename=options.comparefilename))
+
+if __name__ == '__main__':
+    main()
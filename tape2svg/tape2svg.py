@@ -1,11 +1,31 @@
 import math
 import logging
+import logging.handlers
 import os
 import sys
 import time
 import argparse 
+import itertools
+import json
+import shlex
+import re
+import io
+import gzip
+import subprocess
+import signal
+import functools
+import mmap
+import queue
+import atexit
+import cProfile
+import pstats
+import collections
+import concurrent.futures
 
 import font
+import tape
+import codes
+import viewer
 
 from svglib.svglib import svg2rlg
 from reportlab.graphics import renderPDF
@@ -20,8 +40,9 @@ def str2bool(v):
     else:
         raise argparse.ArgumentTypeError('Boolean value expected.')
 
-# Set up argparse and get the command line options.
-def parse_commandline():
+# Set up argparse and get the command line options. Other scripts driving
+# tape2svg in-process pass their own list of arguments.
+def parse_commandline(args=None):
 
     global options
 
@@ -37,6 +58,32 @@ def parse_commandline():
         metavar = 'level'
     )
 
+    parser.add_argument('-ld', '--log-dir',
+        action = 'store',
+        default = os.path.dirname(os.path.realpath(__file__)),
+        help = 'Folder to write tape2svg.log to, empty for no log file (default: %(default)s)',
+        dest = 'logdir',
+        metavar = 'folder'
+    )
+
+    parser.add_argument('-lf', '--log-format',
+        action = 'store',
+        default = 'text',
+        choices = ['text', 'json'],
+        help = 'Write the log file as text or as one JSON object per line (default: %(default)s)',
+        dest = 'logformat',
+        metavar = 'format'
+    )
+
+    parser.add_argument('-ls', '--log-sample',
+        action = 'store',
+        default = 100,
+        type = int,
+        help = 'With -ll DEBUG trace only every nth comment written to the SVG, 1 traces all of them (default: %(default)s)',
+        dest = 'logsample',
+        metavar = 'n'
+    )
+
     parser.add_argument('-if', '--input-file',
         action = 'store',
         default = '',
@@ -57,11 +104,30 @@ def parse_commandline():
         action = 'store',
         default = 8,
         type = int,
+        choices = sorted(codes.LAYOUTS),
         help = 'How many bits in the tape, supported values are 5,7 and 8 (default: %(default)s)',
         dest = 'bitcount',
         metavar = 'num'
     )
 
+    parser.add_argument('-en', '--encoding',
+        action = 'store',
+        default = 'binary',
+        choices = codes.ENCODINGS,
+        help = 'How to punch the input: binary as it is, ascii as 7 bit text or ita2 as 5 bit teleprinter code with letter and figure shifts (default: %(default)s)',
+        dest = 'encoding',
+        metavar = 'encoding'
+    )
+
+    parser.add_argument('-pa', '--parity',
+        action = 'store',
+        default = 'none',
+        choices = codes.PARITIES,
+        help = 'Punch a parity bit in the channel above the code: none, even, odd, mark or space (default: %(default)s)',
+        dest = 'parity',
+        metavar = 'parity'
+    )
+
     parser.add_argument('-li', '--lead-in',
         action = 'store',
         default = 10,
@@ -130,6 +196,24 @@ def parse_commandline():
         metavar = 'flag'
     )
 
+    parser.add_argument('-hp', '--hole-paths',
+        action = 'store',
+        default = False,
+        type = str2bool,
+        help = 'Draw all holes of a tape column as one path each for data and feed holes instead of one circle per hole. Much faster to view and convert, but without a comment for each byte (default: %(default)s)',
+        dest = 'holepaths',
+        metavar = 'flag'
+    )
+
+    parser.add_argument('-rl', '--run-length',
+        action = 'store',
+        default = 0,
+        type = int,
+        help = 'When given draw at least this many rows of the same byte, like lead-in or zero padding, as one rectangle filled with a pattern of the row (default: %(default)s)',
+        dest = 'runlength',
+        metavar = 'rows'
+    )
+
     parser.add_argument('-ps', '--page-size',
         action = 'store',
         default = '',
@@ -141,6 +225,7 @@ def parse_commandline():
     parser.add_argument('-ml', '--margin-left',
         action = 'store',
         default = 0.5,
+        type = float,
         help = 'Left margin of the page in inches (default: %(default)sin) not used it page-size is ''Tape''',
         dest = 'marginleft',
         metavar = 'inches'
@@ -149,6 +234,7 @@ def parse_commandline():
     parser.add_argument('-mt', '--margin-top',
         action = 'store',
         default = 0.5,
+        type = float,
         help = 'Top margin of the page in inches (default: %(default)sin) not used it page-size is ''Tape''',
         dest = 'margintop',
         metavar = 'inches'
@@ -157,6 +243,7 @@ def parse_commandline():
     parser.add_argument('-mr', '--margin-right',
         action = 'store',
         default = 0.5,
+        type = float,
         help = 'Right margin of the page in inches (default: %(default)sin) not used it page-size is ''Tape''',
         dest = 'marginright',
         metavar = 'inches'
@@ -165,6 +252,7 @@ def parse_commandline():
     parser.add_argument('-mb', '--margin-bottom',
         action = 'store',
         default = 0.5,
+        type = float,
         help = 'Bottom margin of the page in inches (default: %(default)sin) not used it page-size is ''Tape''',
         dest = 'marginbottom',
         metavar = 'inches'
@@ -173,6 +261,7 @@ def parse_commandline():
     parser.add_argument('-cs', '--column-space',
         action = 'store',
         default = 0.1,
+        type = float,
         help = 'Space between columns in inches (default: %(default)sin) not used it page-size is ''Tape''',
         dest = 'columnspace',
         metavar = 'inches'
@@ -205,6 +294,67 @@ def parse_commandline():
         metavar = 'inches'
     )
 
+    parser.add_argument('-pk', '--pack',
+        action = 'store',
+        default = '',
+        help = 'Pack many short tapes onto the pages. Each line of the file holds the -pt, -if, -li, -lo and -fn options for one tape (default: %(default)s)',
+        dest = 'packfilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-cp', '--checkpoint',
+        action = 'store',
+        default = False,
+        type = str2bool,
+        help = 'When set record the progress after every completed page so a long render can be resumed (default: %(default)s)',
+        dest = 'checkpoint',
+        metavar = 'flag'
+    )
+
+    parser.add_argument('-rs', '--resume',
+        action = 'store',
+        default = False,
+        type = str2bool,
+        help = 'When set continue an interrupted render after the last completed page (default: %(default)s)',
+        dest = 'resume',
+        metavar = 'flag'
+    )
+
+    parser.add_argument('-sk', '--sink',
+        action = 'store',
+        default = 'file',
+        choices = ['file', 'gzip', 'memory', 'pipe', 'null'],
+        help = 'Where the pages go: ''file'', ''gzip'' compressed files, ''memory'' for callers in the same process, ''pipe'' into a command for each page or ''null'' to only measure rendering (default: %(default)s)',
+        dest = 'sink',
+        metavar = 'sink'
+    )
+
+    parser.add_argument('-sc', '--sink-command',
+        action = 'store',
+        default = '',
+        help = 'Command the pipe sink runs for each page with the page on stdin, {filename} is replaced by the page file name (default: %(default)s)',
+        dest = 'sinkcommand',
+        metavar = 'command'
+    )
+
+    parser.add_argument('-pr', '--profile',
+        action = 'store',
+        default = '',
+        choices = ['', 'cprofile', 'sample'],
+        help = 'Profile the rendering and the PDF: ''cprofile'' saves pstats for each, ''sample'' saves collapsed stacks for flame graphs. The PDF pages are then made in this process (default: %(default)s)',
+        dest = 'profile',
+        metavar = 'profiler'
+    )
+
+    parser.add_argument('-pi', '--profile-interval',
+        action = 'store',
+        default = 0.005,
+        type = float,
+        help = 'How often the sampling profiler looks at the stack in seconds of CPU time (default: %(default)s)',
+        dest = 'profileinterval',
+        metavar = 'seconds'
+    )
+
     parser.add_argument('-pdf', '--pdffile-name',
         action = 'store',
         default = '',
@@ -213,9 +363,80 @@ def parse_commandline():
         metavar = 'filename'
     )
 
-    options = parser.parse_args()
+    parser.add_argument('-ht', '--html-file',
+        action = 'store',
+        default = '',
+        help = 'When given also write the tape to this file as a web page that draws only the rows in view, for tapes too long to view as SVG (default: %(default)s)',
+        dest = 'htmlfilename',
+        metavar = 'filename'
+    )
+
+    parser.add_argument('-pw', '--pdf-workers',
+        action = 'store',
+        default = 0,
+        type = int,
+        help = 'Number of processes reading the pages for the PDF, 0 for one per CPU and 1 to do it all in this process (default: %(default)s)',
+        dest = 'pdfworkers',
+        metavar = 'count'
+    )
+
+    parser.add_argument('-fw', '--fill-workers',
+        action = 'store',
+        default = 0,
+        type = int,
+        help = 'When given lay out the data rows of each page at fixed offsets and have this many processes fill them into the memory-mapped page file, 1 to fill them in this process. Needs the file sink and does not go with -hp, -rl or --pack (default: %(default)s)',
+        dest = 'fillworkers',
+        metavar = 'count'
+    )
+
+    parser.add_argument('-vp', '--volume-pages',
+        action = 'store',
+        default = 0,
+        type = int,
+        help = 'When given split the PDF into volumes of at most this many pages (default: %(default)s)',
+        dest = 'volumepages',
+        metavar = 'count'
+    )
+
+    parser.add_argument('-vs', '--volume-size',
+        action = 'store',
+        default = 0,
+        type = float,
+        help = 'When given start a new PDF volume once one has grown to this many megabytes (default: %(default)s)',
+        dest = 'volumesize',
+        metavar = 'megabytes'
+    )
+
+    options = parser.parse_args(args)
     options.log_level_int = getattr(logging, options.log_level, logging.INFO)
 
+    # Tracing the SVG comments is decided once here, not for every row.
+    options.tracecomments = (options.log_level_int <= logging.DEBUG) and (options.logsample > 0)
+    options.commentcount = 0
+
+    if (options.sink == 'pipe') and not options.sinkcommand:
+        parser.error('The pipe sink needs a command, see -sc.')
+    if options.sink in ('pipe', 'null') and options.pdffilename:
+        parser.error('The {sink} sink keeps no pages to make a PDF from.'.format(sink = options.sink))
+    if options.sink in ('memory', 'pipe', 'null') and (options.checkpoint or options.resume):
+        parser.error('Checkpoints need the pages on disk.')
+    if options.htmlfilename and options.packfilename:
+        parser.error('The HTML viewer shows a single tape, it does not go with --pack.')
+    if (options.profile == 'sample') and not hasattr(signal, 'setitimer'):
+        parser.error('The sampling profiler needs a profiling timer, which this system does not have. Use -pr cprofile.')
+    if options.fillworkers:
+        if options.sink != 'file':
+            parser.error('Fill workers write into page files, they need the file sink.')
+        if options.holepaths or options.runlength or options.packfilename:
+            parser.error('Fill workers draw every row on its own, they do not go with -hp, -rl or --pack.')
+        options.sink = 'mmap'
+    if codes.codewidth(options.encoding, options.parity, options.bitcount) + (options.parity != 'none') > options.bitcount:
+        parser.error('The {encoding} encoding {parity}does not fit in {bitcount} bits.'.format(
+            encoding = options.encoding,
+            parity = 'with parity ' if options.parity != 'none' else '',
+            bitcount = options.bitcount
+        ))
+
     # Create output file name
     if not options.outputfilename:
         if options.inputfilename:
@@ -228,7 +449,9 @@ def parse_commandline():
 
     # The two most common widths were 11/16 inch (17.46 mm) for five bit codes,
     # and 1 inch (25.4 mm) for tapes with six or more bits.
-    options.tapewidth = 11/16 if (options.bitcount <= 5) else 1.0
+    options.tapewidth = codes.LAYOUTS[options.bitcount].width
+    options.feedafter = codes.LAYOUTS[options.bitcount].feedafter
+    (options.holepositions, options.feedposition) = codes.holepositions(options.bitcount)
 
     # Find a page size
     if options.pagesize.upper() == 'A4':
@@ -259,29 +482,390 @@ def parse_commandline():
     options.marginbottom = options.marginbottom + (space-rowspace)
 
     options.pagefilenames = []
+    options.pdffilenames = []
+
+    # Pages rendered with the memory sink, by file name.
+    options.memorypages = {}
+
+    # Instead of an input file a caller can provide a function that returns an
+    # iterator over the data bytes.
+    options.inputdata = None
+
+    # The rows to punch, built before the pages are rendered.
+    options.tape = None
 
     options.outputfile = None
 
-# Set up a logger each for a file in the output folder and the console.      
+    # Hole path mode collects the holes here until the column is complete.
+    options.dataholes = []
+    options.feedholes = []
+    options.blankholes = []
+
+    # Bytes whose row pattern is already defined on the current page.
+    options.runpatterns = set()
+
+    (basename, ext) = os.path.splitext(options.outputfilename)
+    options.checkpointfilename = basename + '.checkpoint'
+
+    # Profiles are named after the output, stacks of all phases go in one file.
+    options.profilebasename = basename
+    options.profilestacks = collections.Counter()
+
+    # Worker processes would hide the PDF work from the profiler.
+    if options.profile:
+        options.pdfworkers = 1
+    options.resumestate = None
+    options.fillexecutor = None
+
+# Where a page goes. Rendering writes lots of small strings, a sink collects
+# them and hands them on joined into large blocks.
+class Sink:
+
+    buffersize = 1 << 20
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, text):
+
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffersize:
+            self.flush()
+
+    def flush(self):
+
+        if self.buffer:
+            self.emit(''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+
+        self.flush()
+        self.finish()
+
+    def emit(self, text):
+        pass
+
+    def finish(self):
+        pass
+
+class FileSink(Sink):
+
+    def __init__(self, filename):
+
+        super().__init__(filename)
+        self.file = open(filename, 'w')
+
+    def emit(self, text):
+        self.file.write(text)
+
+    def finish(self):
+        self.file.close()
+
+class GzipSink(FileSink):
+
+    def __init__(self, filename):
+
+        Sink.__init__(self, filename)
+        self.file = gzip.open(filename, 'wt')
+
+# Keeps the page in options.memorypages for callers in the same process.
+class MemorySink(Sink):
+
+    def __init__(self, filename):
+
+        super().__init__(filename)
+        self.blocks = []
+
+    def emit(self, text):
+        self.blocks.append(text)
+
+    def finish(self):
+        options.memorypages[self.filename] = ''.join(self.blocks)
+
+# Feeds the page to a command, one run of it per page.
+class PipeSink(Sink):
+
+    def __init__(self, filename):
+
+        super().__init__(filename)
+        command = [token.format(filename = filename) for token in shlex.split(options.sinkcommand, posix = (os.name != 'nt'))]
+        self.process = subprocess.Popen(command, stdin = subprocess.PIPE)
+
+    def emit(self, text):
+        self.process.stdin.write(text.encode('utf-8'))
+
+    def finish(self):
+
+        self.process.stdin.close()
+        if self.process.wait():
+            raise subprocess.CalledProcessError(self.process.returncode, self.process.args)
+
+# Throws the page away, to time the rendering alone.
+class NullSink(Sink):
+    pass
+
+# Rows per piece of work for the fill workers.
+FILLROWS = 4096
+
+# A page file written at fixed offsets. The text around the data rows is
+# written as it comes, for the rows only their length is worked out and room
+# is left for them. When the page is done the file is made that size, mapped
+# into memory and the fill workers put the rows into their places side by
+# side. Each row's text depends only on its byte and position, so its length
+# is known beforehand.
+class MmapSink(Sink):
+
+    def __init__(self, filename):
+
+        super().__init__(filename)
+        self.blocks = []
+        self.pieces = []
+        self.offset = 0
+
+    def emit(self, text):
+
+        data = text.encode('utf-8')
+        self.blocks.append((self.offset, data))
+        self.offset += len(data)
+
+    # Leave room for rows running down a column from x, y.
+    def reserve(self, rows, x, y, prefix):
+
+        self.flush()
+
+        for start in range(0, len(rows), FILLROWS):
+            piece = bytes(rows[start:start + FILLROWS])
+            ys = rowpositions(y, len(piece))
+            length = rowslength(piece, x, ys, prefix)
+            self.pieces.append((self.offset, length, piece, x, y, prefix))
+            self.offset += length
+            y = ys[-1]
+
+    def finish(self):
+
+        with open(self.filename, 'w+b') as pagefile:
+            pagefile.truncate(self.offset)
+            with mmap.mmap(pagefile.fileno(), self.offset) as page:
+                for (offset, data) in self.blocks:
+                    page[offset:offset + len(data)] = data
+
+        fillpieces(self.filename, self.pieces)
+
+SINKS = {
+    'file': FileSink,
+    'gzip': GzipSink,
+    'memory': MemorySink,
+    'pipe': PipeSink,
+    'null': NullSink,
+    'mmap': MmapSink
+}
+
+# The holes of every byte for the fill workers, see rowholes().
+fillholes = None
+
+def setup_fill(holes):
+
+    global fillholes
+
+    fillholes = holes
+    rowlengths.cache_clear()
+
+def setup_fillworker(level, holes):
+
+    setup_workerlogging(level)
+    setup_fill(holes)
+
+# The y of count rows from y on and of the row after them, added up the same
+# way as nextPunchRow() does.
+def rowpositions(y, count):
+    return list(itertools.accumulate(itertools.repeat(0.1, count), initial = y))
+
+# Length in bytes of the text of each byte's row in a column at x, with a cy
+# of five characters.
+@functools.lru_cache(maxsize = 64)
+def rowlengths(x, prefix):
+
+    holeprefix = indent(prefix)
+    comment = len(prefix) + len('<!--  -->\n') + len(ROWCOMMENT.format(char = ' ', data = 0))
+
+    circles = {}
+    lengths = []
+    for holes in fillholes:
+        length = comment
+        for hole in holes:
+            if hole not in circles:
+                (cx, r, fill) = hole
+                circles[hole] = len((holeprefix + HOLECIRCLE.format(cx = x + cx, cy = 0.0, r = r, fill = fill)).encode('utf-8'))
+            length += circles[hole]
+        lengths.append(length)
+
+    return lengths
+
+# Length in bytes of the text of the rows at the positions ys.
+def rowslength(rows, x, ys, prefix):
+
+    length = sum(map(rowlengths(x, prefix).__getitem__, rows))
+
+    # Further down the cy take more digits. y only grows, so when the first
+    # and the last row agree all rows between do.
+    holecounts = [len(holes) for holes in fillholes]
+    first = len('{:.3f}'.format(ys[0] + 0.05))
+    last = len('{:.3f}'.format(ys[len(rows) - 1] + 0.05))
+    if first == last:
+        length += (first - 5) * sum(map(holecounts.__getitem__, rows))
+    else:
+        length += sum((len('{:.3f}'.format(y + 0.05)) - 5) * holecounts[data] for (data, y) in zip(rows, ys))
+
+    return length
+
+# The text of rows running down a column, the same as writeSVGDrawByte() writes.
+def rowstext(rows, x, y, prefix):
+
+    holeprefix = indent(prefix)
+
+    lines = []
+    for data in rows:
+        lines.append(prefix + '<!-- ' + ROWCOMMENT.format(
+            char = chr(data) if (data >= 0x20) and (data <= 0x7e) else ' ',
+            data = data
+        ) + ' -->\n')
+        for (cx, r, fill) in fillholes[data]:
+            lines.append(holeprefix + HOLECIRCLE.format(cx = x + cx, cy = y + 0.05, r = r, fill = fill))
+        y += 0.1
+
+    return ''.join(lines)
+
+# Put pieces of rows into their places in the page file.
+def fillrows(filename, pieces):
+
+    with open(filename, 'r+b') as pagefile, mmap.mmap(pagefile.fileno(), 0) as page:
+        for (offset, length, rows, x, y, prefix) in pieces:
+            data = rowstext(rows, x, y, prefix).encode('utf-8')
+
+            # Text of another length would overwrite what comes next or
+            # leave a gap.
+            if len(data) != length:
+                raise RuntimeError('Rows at offset {offset} of {filename} came out {actual} bytes long instead of {length}.'.format(
+                    offset = offset,
+                    filename = filename,
+                    actual = len(data),
+                    length = length
+                ))
+
+            page[offset:offset + length] = data
+
+# Fill the rows of a page, in this process or by the workers. Small pieces
+# are handed out together.
+def fillpieces(filename, pieces):
+
+    if options.fillworkers == 1:
+        fillrows(filename, pieces)
+        return
+
+    if not options.fillexecutor:
+        options.fillexecutor = concurrent.futures.ProcessPoolExecutor(max_workers = options.fillworkers,
+            initializer = setup_fillworker, initargs = (logging.getLogger().level, fillholes))
+
+    futures = []
+    batch = []
+    batchrows = 0
+    for piece in pieces:
+        batch.append(piece)
+        batchrows += len(piece[2])
+        if batchrows >= FILLROWS:
+            futures.append(options.fillexecutor.submit(fillrows, filename, batch))
+            batch = []
+            batchrows = 0
+    if batch:
+        futures.append(options.fillexecutor.submit(fillrows, filename, batch))
+
+    for future in futures:
+        future.result()
+
+# A rendered page as bytes, wherever the sink has put it.
+def readpage(pagefilename):
+
+    if pagefilename in options.memorypages:
+        return options.memorypages[pagefilename].encode('utf-8')
+
+    with open(pagefilename, 'rb') as pagefile:
+        data = pagefile.read()
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+
+    return data
+
+# Log records as one JSON object per line, for tools to read.
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record):
+
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.thread,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry)
+
+# Set up a logger each for a file in the log folder and the console. Records
+# only go into a queue where they are made, a thread of its own formats and
+# writes them so rendering never waits for the console or the disk.
 def setup_logging():
   
     global options
-  
-    fh = logging.FileHandler(os.path.dirname(os.path.realpath(__file__)) + '\\tape2svg.log')
-    fh.setLevel(options.log_level_int)
+
+    handlers = []
 
     ch = logging.StreamHandler()
     ch.setLevel(options.log_level_int)
-
     ch.setFormatter(logging.Formatter('({thread}) [{levelname:7}] {name} - {message}', style='{'))
-    fh.setFormatter(logging.Formatter('{asctime} ({thread}) [{levelname:7}] {name} - {message}', style='{'))
+    handlers.append(ch)
+
+    if options.logdir:
+        fh = logging.FileHandler(os.path.join(options.logdir, 'tape2svg.log'))
+        fh.setLevel(options.log_level_int)
+        if options.logformat == 'json':
+            fh.setFormatter(JSONFormatter())
+        else:
+            fh.setFormatter(logging.Formatter('{asctime} ({thread}) [{levelname:7}] {name} - {message}', style='{'))
+        handlers.append(fh)
+
+    logqueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(logqueue, *handlers, respect_handler_level = True)
+    listener.start()
+
+    # Whatever is still in the queue is written before the program ends.
+    atexit.register(listener.stop)
 
     root = logging.getLogger()
-    root.addHandler(ch)
-    root.addHandler(fh)
-    root.setLevel(logging.DEBUG)
+    root.addHandler(logging.handlers.QueueHandler(logqueue))
+    root.setLevel(options.log_level_int)
+
+    logging.getLogger('svglib.svglib').setLevel(max(options.log_level_int, logging.INFO))
 
-    logging.getLogger('svglib.svglib').setLevel(logging.INFO)
+# Worker processes forked for the PDF inherit the queue, but not the thread
+# that empties it. They log to the console directly.
+def setup_workerlogging(level):
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    ch = logging.StreamHandler()
+    ch.setFormatter(logging.Formatter('({thread}) [{levelname:7}] {name} - {message}', style='{'))
+    root.addHandler(ch)
+    root.setLevel(level)
   
 def indent(str):
     return str + ' '*4
@@ -308,14 +892,17 @@ def writeSVGHeader():
     options.indent = indent(options.indent)
     options.indent = indent(options.indent)
 
-def writeSVGDrawTape():
+# Draw the background for a section of tape starting at the current position.
+# Without a height the section runs to the bottom margin.
+def writeSVGDrawTape(height=None):
     
     global options
 
     writeSVGComment('Tape background')
     options.indent = indent(options.indent)
     try:
-        height = height=min(options.tapelength, options.pagesize[1] - options.margintop - options.marginbottom)
+        if height is None:
+            height = min(options.tapelength, options.pagesize[1] - options.margintop - options.marginbottom)
 
         # Create a clip path around the current tape section
         options.clippathid = 'tape-section-' + str(options.rowspunched) 
@@ -358,7 +945,9 @@ def writeSVGDrawTape():
             # a position along the complete tape, relative to the top of this section.
             markerpos = math.floor(toptapeoffset / arrowdistance) * arrowdistance - arrowdistance - toptapeoffset + 2
             
-            while markerpos < toptapeoffset + height:
+            # Arrows reach up from their marker by half the tape width. Markers
+            # further down are clipped away entirely.
+            while markerpos < height + options.tapewidth:
                 
                 # Group for common clipping.
                 options.outputfile.write(options.indent + '<g clip-path="url(#{clippathid})">\n'.format(
@@ -368,7 +957,7 @@ def writeSVGDrawTape():
                 try:
 
                     left = options.x + 0.1
-                    bottom = markerpos + options.margintop
+                    bottom = markerpos + options.y
                     right = options.x + options.tapewidth - 0.1
                     top = bottom - (right - left) / 2
                     center = (left + right) / 2
@@ -423,12 +1012,12 @@ def writeSVGDrawTape():
                     if not options.reverse:
                         options.outputfile.write(options.indent + '<text stroke="none" fill="blue" letter-spacing="0.5em" font-size="10pt" font-family="sans-serif" transform="translate({left}, {top}) rotate(90)">DIGITAL EQUIPMENT CORPORATION - PROGRAMMED DATA PROCESSOR</text>\n'.format(
                             left = 96 * (options.x + options.tapewidth - 0.2),
-                            top = 96 * (markerpos + options.margintop + 0.5)
+                            top = 96 * (markerpos + options.y + 0.5)
                         ))
 
                         options.outputfile.write(options.indent + '<text stroke="blue" stroke-width="2px" fill="none" font-size="44pt" font-family="sans-serif" transform="translate({left}, {top}) rotate(90)">PDP</text>\n'.format(
                             left = 96 * (options.x + 0.15),
-                            top = 96 * (markerpos + options.margintop + 4.5)
+                            top = 96 * (markerpos + options.y + 4.5)
                         ))
                 finally:
                     options.indent = unindent(options.indent)
@@ -441,7 +1030,8 @@ def writeSVGDrawTape():
     finally:
         options.indent = unindent(options.indent)
 
-    if options.cutmarks:
+    # Packed pages mark the ends of each tape themselves.
+    if options.cutmarks and not options.packfilename:
         
         writeSVGComment('Cut marks')
         options.indent = indent(options.indent)
@@ -512,6 +1102,10 @@ def nextPunchRow():
     global options
 
     options.y += 0.1 
+
+    # Packed pages are laid out beforehand.
+    if options.packfilename:
+        return
     
     # Have we passed the bottom of the tape section?
     if options.y - (options.pagesize[1] - options.marginbottom) + 0.1 > 0.01: # Epsilonitis
@@ -523,12 +1117,17 @@ def nextPunchRow():
         # Reduce tape length by what we have already rendered: One full column.
         options.tapelength = options.tapelength - (options.pagesize[1] - options.margintop - options.marginbottom)
         
-        if options.x + options.tapewidth > options.pagesize[0]:
+        if options.x < options.marginleft - 0.01: # Epsilonitis
             # New page
             closepage()
         else:
             writeSVGDrawTape()
 
+# The text of a row drawn hole by hole: a comment with the byte and a circle
+# for each hole.
+ROWCOMMENT = '{char} - {data:#04x} - {data:#010b}'
+HOLECIRCLE = '<circle cx="{cx:.3f}in" cy="{cy:.3f}in" r="{r}in" fill="{fill}"/>\n'
+
 def writeSVGDrawByte(data):
 
     global options
@@ -541,14 +1140,16 @@ def writeSVGDrawByte(data):
     if not options.outputfile:
         newpage()
 
-    writeSVGComment('{char} - {data:#04x} - {data:#010b}'.format(
-        char = chr(data) if (data >= 0x20) and (data <= 0x7e) else ' ',
-        data = data
-    ))
+    # In hole path mode the holes go into the column's paths and the rows are
+    # not commented one by one.
+    if not options.holepaths:
+        writeSVGComment(ROWCOMMENT.format(
+            char = chr(data) if (data >= 0x20) and (data <= 0x7e) else ' ',
+            data = data
+        ))
     options.indent = indent(options.indent)
     try:
-        cx = options.tapewidth - 0.1 # Least significant bit on the right
-        for bitindex in range(0, 8):
+        for (bitindex, cx) in enumerate(options.holepositions):
             bit = data & 1
             data >>= 1
 
@@ -558,30 +1159,209 @@ def writeSVGDrawByte(data):
                 fill = options.tapecolor
 
             if ((options.onlyrenderholes == True) and (bit)) or (options.onlyrenderholes == False):
-                options.outputfile.write(options.indent + '<circle cx="{cx:.3f}in" cy="{cy:.3f}in" r="0.036in" fill="{fill}"/>\n'.format(
-                    cx=options.x + cx,
-                    cy=options.y + 0.05,
-                    fill=fill
-                ))
-
-            cx -= 0.1
+                if options.holepaths:
+                    (options.dataholes if bit else options.blankholes).append(holesubpath(options.x + cx, options.y + 0.05, 0.036))
+                else:
+                    options.outputfile.write(options.indent + HOLECIRCLE.format(
+                        cx=options.x + cx,
+                        cy=options.y + 0.05,
+                        r=0.036,
+                        fill=fill
+                    ))
 
-            if bitindex==2:
+            if bitindex == options.feedafter - 1:
                 # Feed hole
-                options.outputfile.write(options.indent + '<circle cx="{cx:.3f}in" cy="{cy:.3f}in" r="0.023in" fill="{fill}"/>\n'.format(
-                    cx=options.x + cx,
-                    cy=options.y + 0.05,
-                    fill=options.holecolor
-                ))                
-                cx -= 0.1
+                if options.holepaths:
+                    options.feedholes.append(holesubpath(options.x + options.feedposition, options.y + 0.05, 0.023))
+                else:
+                    options.outputfile.write(options.indent + HOLECIRCLE.format(
+                        cx=options.x + options.feedposition,
+                        cy=options.y + 0.05,
+                        r=0.023,
+                        fill=options.holecolor
+                    ))                
     finally:
         options.indent = unindent(options.indent)
     
     # Next row
+    advancerow()
+
+# Step over a row that has been drawn.
+def advancerow():
+
+    global options
+
     nextPunchRow()
     options.rowspunched += 1
 
-def writeSVGDrawData():
+    # That row may have filled the page.
+    if options.checkpoint and not options.outputfile:
+        writecheckpoint(False)
+
+# The holes of one row as (distance from the left edge of the tape, radius, fill).
+def rowholes(data):
+
+    global options
+
+    holes = []
+    for (bitindex, cx) in enumerate(options.holepositions):
+        bit = data & 1
+        data >>= 1
+
+        if bit or not options.onlyrenderholes:
+            holes.append((cx, 0.036, options.holecolor if bit else options.tapecolor))
+
+        if bitindex == options.feedafter - 1:
+            # Feed hole
+            holes.append((options.feedposition, 0.023, options.holecolor))
+
+    return holes
+
+# Define the pattern for rows of a byte on this page, in inches.
+def writeSVGRunPattern(data):
+
+    global options
+
+    if data in options.runpatterns:
+        return
+    options.runpatterns.add(data)
+
+    options.outputfile.write(options.indent + '<pattern id="row-{data:02x}" patternUnits="userSpaceOnUse" width="{width:.3f}" height="0.1">\n'.format(
+        data = data,
+        width = options.tapewidth
+    ))
+    for (cx, r, fill) in rowholes(data):
+        options.outputfile.write(indent(options.indent) + '<circle cx="{cx:.3f}" cy="0.05" r="{r}" fill="{fill}"/>\n'.format(
+            cx = cx,
+            r = r,
+            fill = fill
+        ))
+    options.outputfile.write(options.indent + '</pattern>\n')
+
+# Draw count rows of the same byte as rectangles filled with the pattern of
+# one row, one for each column the rows run through. Each of them stands on its
+# own so a resumed render draws its pages just the same.
+def writeSVGDrawRun(data, count):
+
+    global options
+
+    while count:
+        if not options.outputfile:
+            newpage()
+
+        rows = min(count, int(round((options.pagesize[1] - options.marginbottom - options.y) / 0.1)))
+
+        writeSVGComment('{rows} x {data:#04x} - {data:#010b}'.format(
+            rows = rows,
+            data = data
+        ))
+        writeSVGRunPattern(data)
+        options.outputfile.write(options.indent + '<rect transform="scale(96) translate({x:.3f},{y:.3f})" width="{width:.3f}" height="{height:.1f}" fill="url(#row-{data:02x})"/>\n'.format(
+            x = options.x,
+            y = options.y,
+            width = options.tapewidth,
+            height = rows * 0.1,
+            data = data
+        ))
+
+        # Go to the last row and step over it like over any other, which
+        # starts the next column or page when needed.
+        options.y += (rows - 1) * 0.1
+        options.rowspunched += rows - 1
+        advancerow()
+
+        count -= rows
+
+# Draw count rows of the same byte, as a run if there are enough of them.
+def writeSVGDrawBytes(data, count):
+
+    global options
+
+    if options.runlength and count >= options.runlength:
+        writeSVGDrawRun(data, count)
+    else:
+        for _ in range(count):
+            writeSVGDrawByte(data)
+
+# A circle as part of a path, in inches.
+def holesubpath(cx, cy, r):
+
+    return 'M{x:.3f},{y:.3f}a{r},{r} 0 1,0 {d},0a{r},{r} 0 1,0 -{d},0z'.format(
+        x = cx - r,
+        y = cy,
+        r = r,
+        d = 2 * r
+    )
+
+# Write the holes collected in hole path mode. The paths are drawn in inches,
+# scaled to the 96 user units per inch of the page.
+def writeSVGHolePaths():
+
+    global options
+
+    for (holes, fill) in ((options.blankholes, options.tapecolor), (options.dataholes, options.holecolor), (options.feedholes, options.holecolor)):
+        if holes:
+            options.outputfile.write(options.indent + '<path transform="scale(96)" fill="{fill}" d="{d}"/>\n'.format(
+                fill = fill,
+                d = ''.join(holes)
+            ))
+            del holes[:]
+
+# The data bytes from the input file or the caller, None if there are none.
+def inputbytes():
+
+    global options
+
+    if options.inputdata:
+        return bytes(options.inputdata())
+
+    if options.inputfilename:
+        with open(options.inputfilename, 'rb') as inputfile:
+            return inputfile.read()
+
+    return None
+
+# All rows of a tape: lead-in, title, data and lead-out.
+def buildtape(leadin, punchtitle, fontname, data, leadout):
+
+    global options
+
+    rows = tape.Tape(options.bitcount)
+    rows.append('leadin', bytes(leadin))
+    if punchtitle:
+        # The 4x5 font sits in the five channels at the top, which are all of
+        # them on five level tape.
+        shift = (8 - options.bitcount) if fontname == '4x5' else 0
+        rows.append('title', bytes(row >> shift for row in punchrows(punchtitle, fontname)))
+    if data is not None:
+        rows.append('data', codes.encode(data, options.encoding, options.parity, options.bitcount))
+    rows.append('leadout', bytes(leadout))
+
+    return rows
+
+# Leave room for the rows, a column at a time, and step over them like over
+# any other. The fill workers put them in when the page is closed.
+def writeSVGFillRows(rows):
+
+    global options
+
+    start = 0
+    while start < len(rows):
+        if not options.outputfile:
+            newpage()
+
+        count = min(len(rows) - start, int(round((options.pagesize[1] - options.marginbottom - options.y) / 0.1)))
+        options.outputfile.reserve(rows[start:start + count], options.x, options.y, options.indent)
+        options.commentcount += count
+
+        for _ in range(count):
+            advancerow()
+
+        start += count
+
+# Draw the data bytes. When resuming the first skip bytes are already on
+# completed pages.
+def writeSVGDrawData(rows, skip=0):
 
     global options
 
@@ -590,23 +1370,24 @@ def writeSVGDrawData():
     if not options.outputfile:
         newpage()
     
-    writeSVGComment('{n} bytes of data'.format(n=os.stat(options.inputfilename).st_size))
-    options.indent = indent(options.indent)
+    # A resumed segment starts on a fresh page, whose indent has been reset
+    # just like in an uninterrupted render.
+    if not skip:
+        writeSVGComment('{n} bytes of data'.format(n=len(rows)))
+        options.indent = indent(options.indent)
     try:        
     
         bytecount = 0    
 
-        inputfile = open(options.inputfilename, 'rb')
-        try:
-            read = inputfile.read(1)
-            while read != b'':
-                bytecount += 1
+        if options.fillworkers:
+            bytecount = len(rows) - skip
+            writeSVGFillRows(rows[skip:])
+        else:
+            for (data, run) in itertools.groupby(rows[skip:]):
+                count = sum(1 for _ in run)
+                bytecount += count
 
-                writeSVGDrawByte(read[0])
-
-                read = inputfile.read(1)
-        finally:
-            inputfile.close()    
+                writeSVGDrawBytes(data, count)
 
     finally:
         options.indent = unindent(options.indent)
@@ -620,17 +1401,25 @@ def writeSVGComment(comment):
 
     global options
 
-    logger = logging.getLogger('main')
-    logger.debug('<!-- ' + comment + ' -->')
+    # One in so many comments is traced, a record for every row would take
+    # longer than the row itself.
+    if options.tracecomments:
+        options.commentcount += 1
+        if (options.commentcount - 1) % options.logsample == 0:
+            logger = logging.getLogger('main')
+            logger.debug('<!-- ' + comment + ' --> (comment {count})'.format(count = options.commentcount))
 
     if not options.outputfile:
         newpage()
 
-    options.outputfile.write(options.indent + '<!-- ' + comment + ' -->\n')
+    # Every new column and section starts with a comment, the holes before
+    # it are complete.
+    writeSVGHolePaths()
 
-def writeSVGDrawPunchString8x8(string):
+    options.outputfile.write(options.indent + '<!-- ' + comment + ' -->\n')
 
-    global options
+# The rows to punch for a string in the 8x8 font.
+def punchrows8x8(string):
 
     fontdata = font.font8x8_basic
 
@@ -654,11 +1443,10 @@ def writeSVGDrawPunchString8x8(string):
                             byte = byte | bit
                         bit *= 2
                         
-                    writeSVGDrawByte(byte) 
+                    yield byte
 
-def writeSVGDrawPunchString4x5(string):
-
-    global options
+# The rows to punch for a string in the 4x5 font.
+def punchrows4x5(string):
 
     fontdata = font.font4x5
 
@@ -671,26 +1459,33 @@ def writeSVGDrawPunchString4x5(string):
                 for b in glyph:
                     # Reverse bits
                     b = int('{:08b}'.format(b)[::-1], 2)
-                    writeSVGDrawByte(b)
-                writeSVGDrawByte(0)
+                    yield b
+                yield 0
+
+# The rows to punch for a string in the named font.
+def punchrows(string, fontname):
+
+    if fontname == '8x8':
+        return punchrows8x8(string)
+    elif fontname == '4x5':
+        return punchrows4x5(string)
+    else:
+        raise ValueError('Font name ''{fontname}'' not supported.'.format(fontname = fontname))
 
-def writeSVGDrawPunchString(string):
+def writeSVGDrawPunchString(string, rows, skip=0):
 
     global options
 
     if not options.outputfile:
         newpage()
 
-    writeSVGComment('Punch text \'' + string + '\'')
-    options.indent = indent(options.indent)
+    if not skip:
+        writeSVGComment('Punch text \'' + string + '\'')
+        options.indent = indent(options.indent)
     
     try:
-        if options.fontname == '8x8':
-            writeSVGDrawPunchString8x8(string)
-        elif options.fontname == '4x5':
-            writeSVGDrawPunchString4x5(string)
-        else:
-            raise ValueError('Font name ''{fontname}'' not supported.'.format(fontname = options.fontname))
+        for byte in rows[skip:]:
+            writeSVGDrawByte(byte)
     
     finally:
         options.indent = unindent(options.indent)
@@ -712,6 +1507,8 @@ def closepage():
 
     if options.outputfile:
         
+        writeSVGHolePaths()
+
         # For back sides: Close mirroring group        
         if options.reverse:
             options.outputfile.write(options.indent + '</g>\n')
@@ -744,8 +1541,9 @@ def newpage():
 
     options.pagefilenames.append(pagefilename)
 
-    options.outputfile = open(pagefilename, 'w')
+    options.outputfile = SINKS[options.sink](pagefilename)
     options.indent = ''
+    options.runpatterns = set()
     
     options.x = options.pagesize[0] - options.marginright - options.tapewidth
     options.y = options.margintop
@@ -759,7 +1557,8 @@ def newpage():
             translate = -96 * options.pagesize[1]            
         ))
 
-    writeSVGDrawTape()
+    if not options.packfilename:
+        writeSVGDrawTape()
 
 def createpages(reverse):
 
@@ -768,21 +1567,7 @@ def createpages(reverse):
     logger = logging.getLogger('main')
 
     # Size the tape in inches
-    options.tapelength = options.leadin * 0.1
-     
-    if options.inputfilename:
-        options.tapelength += os.stat(options.inputfilename).st_size * 0.1 
-
-    if options.punchtitle:
-        if options.punchtitle:
-            if options.fontname == '8x8':
-                options.tapelength += 8 * len(options.punchtitle) * 0.1
-            elif options.fontname == '4x5':
-                options.tapelength += 5 * len(options.punchtitle) * 0.1
-            else:
-                raise ValueError('Font name ''{fontname}'' not supported.'.format(fontname = options.fontname))
-
-    options.tapelength += options.leadout * 0.1
+    options.tapelength = len(options.tape) * 0.1
 
     # In Tape mode size page to the tape itself
     if options.pagesize[1] == 0:
@@ -792,29 +1577,51 @@ def createpages(reverse):
     options.pagenumber = -1
     options.reverse = reverse
 
-    writeSVGComment('{n} bytes of lead-in'.format(n=options.leadin))
-    options.indent = indent(options.indent)
-    try:        
-        for _ in range(0, options.leadin):
-            writeSVGDrawByte(0)    
-    finally:
-        options.indent = unindent(options.indent)
-
-    if options.punchtitle:
-        writeSVGDrawPunchString(options.punchtitle)
-        
-    if options.inputfilename:
-        writeSVGDrawData()
+    if options.fillworkers:
+        setup_fill([rowholes(data) for data in range(256)])
+
+    # When resuming pick up the state after the last completed page. The rows
+    # on it are skipped segment by segment instead of being drawn again.
+    skip = 0
+    if options.resumestate and (options.resumestate['reverse'] == reverse):
+        skip = options.resumestate['rowspunched']
+        options.rowspunched = skip
+        options.pagenumber = options.resumestate['pagenumber']
+        options.tapelength = options.resumestate['tapelength']
+        logger.info('Resuming {side} pages after page #{n} at row {row}.'.format(
+            side = 'back' if reverse else 'front',
+            n = options.pagenumber + 1,
+            row = skip
+        ))
 
-    writeSVGComment('{n} bytes of lead-out'.format(n=options.leadout))
-    options.indent = indent(options.indent)
-    try:        
-        for _ in range(0, options.leadout):
-            writeSVGDrawByte(0)    
-    finally:
-        options.indent = unindent(options.indent)
+    for segment in options.tape.segments:
+        done = min(skip, segment.length)
+        skip -= done
+        if done == segment.length:
+            continue
+
+        rows = options.tape.segmentview(segment)
+        if segment.name == 'title':
+            writeSVGDrawPunchString(options.punchtitle, rows, done)
+        elif segment.name == 'data':
+            writeSVGDrawData(rows, done)
+        else:
+            if not done:
+                writeSVGComment('{n} bytes of {lead}'.format(n=segment.length, lead='lead-in' if segment.name == 'leadin' else 'lead-out'))
+                options.indent = indent(options.indent)
+            try:
+                writeSVGDrawBytes(0, segment.length - done)
+            finally:
+                options.indent = unindent(options.indent)
 
     closepage()
+
+    if options.fillexecutor:
+        options.fillexecutor.shutdown()
+        options.fillexecutor = None
+
+    if options.checkpoint:
+        writecheckpoint(True)
     
     logger.info('{rowspunched} rows punched. Generated {pages} page{s} of SVG.'.format(
         rowspunched=options.rowspunched,
@@ -822,6 +1629,368 @@ def createpages(reverse):
         s = 's' if options.pagenumber > 0 else ''
     ))
 
+# What decides the rendered pages. A checkpoint only fits the same settings.
+def checkpointfingerprint():
+
+    global options
+
+    fingerprint = { key: getattr(options, key) for key in (
+        'inputfilename', 'outputfilename', 'bitcount', 'encoding', 'parity', 'leadin', 'leadout', 'punchtitle', 'fontname',
+        'cutmarks', 'tapecolor', 'holecolor', 'onlyrenderholes', 'holepaths', 'runlength', 'pagesize', 'marginleft', 'margintop',
+        'marginright', 'marginbottom', 'columnspace', 'decarrows', 'fanfold') }
+
+    fingerprint['pagesize'] = list(fingerprint['pagesize'])
+    if options.inputfilename:
+        stat = os.stat(options.inputfilename)
+        fingerprint['inputstat'] = [stat.st_size, stat.st_mtime_ns]
+    elif options.inputdata:
+        fingerprint['inputstat'] = [len(options.tape), options.tape.crc]
+
+    return fingerprint
+
+# Record the progress so far. Written after every completed page and at the end
+# of each side, replacing the previous checkpoint in one step.
+def writecheckpoint(sidedone):
+
+    global options
+
+    state = {
+        'fingerprint': checkpointfingerprint(),
+        'reverse': options.reverse,
+        'sidedone': sidedone,
+        'pagenumber': options.pagenumber,
+        'rowspunched': options.rowspunched,
+        'tapelength': options.tapelength,
+        'x': options.x,
+        'y': options.y,
+        'pagefilenames': options.pagefilenames
+    }
+
+    with open(options.checkpointfilename + '.tmp', 'w') as checkpointfile:
+        json.dump(state, checkpointfile)
+    os.replace(options.checkpointfilename + '.tmp', options.checkpointfilename)
+
+def readcheckpoint():
+
+    global options
+
+    with open(options.checkpointfilename, 'r') as checkpointfile:
+        state = json.load(checkpointfile)
+
+    if state['fingerprint'] != json.loads(json.dumps(checkpointfingerprint())):
+        raise ValueError('Checkpoint {checkpointfilename} was written with different options or input.'.format(
+            checkpointfilename = options.checkpointfilename
+        ))
+
+    return state
+
+# Read the tapes to pack, one line of options each.
+def readpackjobs():
+
+    global options
+
+    parser = argparse.ArgumentParser(prog = 'pack job')
+    parser.add_argument('-pt', '--punch-title', default = '', dest = 'punchtitle')
+    parser.add_argument('-if', '--input-file', default = '', dest = 'inputfilename')
+    parser.add_argument('-li', '--lead-in', default = options.leadin, type = int, dest = 'leadin')
+    parser.add_argument('-lo', '--lead-out', default = options.leadout, type = int, dest = 'leadout')
+    parser.add_argument('-fn', '--font-name', default = options.fontname, dest = 'fontname')
+
+    jobs = []
+    with open(options.packfilename, 'r') as packfile:
+        for line in packfile:
+            if line.strip() and not line.lstrip().startswith('#'):
+                job = parser.parse_args(shlex.split(line))
+                data = None
+                if job.inputfilename:
+                    with open(job.inputfilename, 'rb') as inputfile:
+                        data = inputfile.read()
+                job.tape = buildtape(job.leadin, job.punchtitle, job.fontname, data, job.leadout)
+                job.rows = len(job.tape)
+                jobs.append(job)
+
+    return jobs
+
+# How many rows fit into a column and how many columns onto a page.
+def columnlayout():
+
+    columnrows = int(round((options.pagesize[1] - options.margintop - options.marginbottom) / 0.1))
+    columnsperpage = int((options.pagesize[0] - options.marginleft - options.marginright + options.columnspace + 0.01) // (options.tapewidth + options.columnspace))
+
+    return (columnrows, columnsperpage)
+
+# Distribute the tapes over columns and pages. Tapes longer than a column are
+# cut into column-sized pieces, then the pieces are packed first-fit
+# decreasing. Returns a list of pages, each a list of columns, each a list of
+# pieces as (job, first row, row count, top row).
+def packjobs(jobs):
+
+    (columnrows, columnsperpage) = columnlayout()
+    gaprows = max(1, int(math.ceil(options.columnspace / 0.1 - 0.01)))
+
+    if (columnrows < 1) or (columnsperpage < 1):
+        raise ValueError('Packing needs a page size with room for at least one column.')
+
+    pieces = []
+    for job in jobs:
+        for first in range(0, job.rows, columnrows):
+            pieces.append((job, first, min(columnrows, job.rows - first)))
+
+    pieces.sort(key=lambda piece: piece[2], reverse=True)
+
+    columns = []
+    used = []
+    for (job, first, rows) in pieces:
+        for (i, column) in enumerate(columns):
+            top = used[i] + gaprows
+            if top + rows <= columnrows:
+                column.append((job, first, rows, top))
+                used[i] = top + rows
+                break
+        else:
+            columns.append([(job, first, rows, 0)])
+            used.append(rows)
+
+    return [columns[i:i + columnsperpage] for i in range(0, len(columns), columnsperpage)]
+
+# Short marks in the column space at the top and bottom end of a packed piece.
+def writeSVGPieceCutMarks(top, bottom):
+
+    global options
+
+    writeSVGComment('Cut marks')
+    options.indent = indent(options.indent)
+    try:
+        for y in (top, bottom):
+            for (left, right) in ((options.x - options.columnspace / 2, options.x), (options.x + options.tapewidth, options.x + options.tapewidth + options.columnspace / 2)):
+                options.outputfile.write(options.indent + '<line x1="{left:.3f}in" y1="{top:.3f}in" x2="{right:.3f}in" y2="{top:.3f}in" stroke-dasharray="1,2" stroke="#ccc" stroke-width="1px" />\n'.format(
+                    left = left,
+                    right = right,
+                    top = y
+                ))
+    finally:
+        options.indent = unindent(options.indent)
+
+# Render packed pages for all tapes in the pack file and report how much of
+# each page is used.
+def packpages(reverse):
+
+    global options
+
+    logger = logging.getLogger('main')
+
+    jobs = readpackjobs()
+    pages = packjobs(jobs)
+
+    options.rowspunched = 0
+    options.pagenumber = -1
+    options.reverse = reverse
+
+    (columnrows, columnsperpage) = columnlayout()
+
+    for page in pages:
+        newpage()
+
+        for (c, column) in enumerate(page):
+            for (job, first, rows, top) in column:
+                options.x = options.pagesize[0] - options.marginright - options.tapewidth - c * (options.tapewidth + options.columnspace)
+                options.y = options.margintop + top * 0.1
+
+                # Arrows and clip ids follow the position along the whole tape.
+                options.rowspunched = first
+                options.tapelength = rows * 0.1
+
+                writeSVGComment('Tape \'{title}\' rows {first} to {last}'.format(title=job.punchtitle or job.inputfilename, first=first, last=first + rows - 1))
+                writeSVGDrawTape(rows * 0.1)
+                if options.cutmarks:
+                    writeSVGPieceCutMarks(options.y, options.y + rows * 0.1)
+
+                for (byte, run) in itertools.groupby(job.tape.view(first, first + rows)):
+                    writeSVGDrawBytes(byte, sum(1 for _ in run))
+
+        if not reverse:
+            usedrows = sum(rows for column in page for (_, _, rows, _) in column)
+            logger.info('Page #{n}: {columns} column{s}, {used:.0f}% used.'.format(
+                n = options.pagenumber + 1,
+                columns = len(page),
+                s = '' if len(page) == 1 else 's',
+                used = 100 * usedrows / (columnrows * columnsperpage)
+            ))
+
+    closepage()
+
+    logger.info('Packed {jobs} tape{s} onto {pages} page{ps}.'.format(
+        jobs = len(jobs),
+        s = '' if len(jobs) == 1 else 's',
+        pages = len(pages),
+        ps = '' if len(pages) == 1 else 's'
+    ))
+
+# A single page PDF made by reportlab, taken apart into its objects by number.
+# Also returns the numbers of the catalog, the document info and the page tree,
+# which are the parts that are not copied.
+def readPDFobjects(pdfdata):
+
+    xref = int(pdfdata[pdfdata.rindex(b'startxref') + 9:].split()[0])
+    (header, trailer) = pdfdata[xref:].split(b'trailer', 1)
+
+    offsets = [int(line[:10]) for line in header.split(b'\n')[3:] if line]
+    ends = offsets[1:] + [xref]
+
+    objects = {}
+    for (n, (start, end)) in enumerate(zip(offsets, ends), start = 1):
+        body = pdfdata[start:end]
+        objects[n] = body[body.index(b'obj') + 3:body.rindex(b'endobj')].strip(b'\n')
+
+    root = int(re.search(rb'/Root (\d+) 0 R', trailer).group(1))
+    info = int(re.search(rb'/Info (\d+) 0 R', trailer).group(1))
+    pages = int(re.search(rb'/Pages (\d+) 0 R', objects[root]).group(1))
+
+    return (objects, (root, info, pages))
+
+# Writes a PDF a page at a time. Each page comes as a complete one page PDF
+# whose objects are copied over under new numbers. Only the offsets of the
+# objects are remembered, so memory does not grow with the number of pages.
+class StreamingPDF:
+
+    def __init__(self, filename):
+
+        self.file = open(filename, 'wb')
+        self.file.write(b'%PDF-1.4\n%\x93\x8c\x8b\x9e\n')
+
+        # Objects 1 and 2 are the catalog and the page tree, written at the end.
+        self.offsets = [None, None]
+        self.kids = []
+
+        # The fonts are the same on every page, keep one copy.
+        self.shared = {}
+
+    def reserve(self):
+
+        self.offsets.append(None)
+        return len(self.offsets)
+
+    def writeobject(self, n, body):
+
+        self.offsets[n - 1] = self.file.tell()
+        self.file.write(b'%d 0 obj\n' % n + body + b'\nendobj\n')
+
+    def addpage(self, pdfdata):
+
+        (objects, (root, info, pages)) = readPDFobjects(pdfdata)
+
+        numbers = { pages: 2 }
+        writes = []
+        for (n, body) in objects.items():
+            if n in (root, info, pages):
+                continue
+            if not (b' 0 R' in body or b'stream' in body):
+                if body not in self.shared:
+                    self.shared[body] = self.reserve()
+                    writes.append((n, body))
+                numbers[n] = self.shared[body]
+            else:
+                numbers[n] = self.reserve()
+                writes.append((n, body))
+
+        for (n, body) in writes:
+            # References only appear in the dictionary, never touch stream data.
+            (dictionary, stream) = (body.split(b'stream', 1) + [None])[:2]
+            dictionary = re.sub(rb'(\d+) 0 R', lambda m: b'%d 0 R' % numbers[int(m.group(1))], dictionary)
+            self.writeobject(numbers[n], dictionary if stream is None else dictionary + b'stream' + stream)
+
+            if re.search(rb'/Type /Page\b(?!s)', dictionary):
+                self.kids.append(numbers[n])
+
+    def size(self):
+
+        return self.file.tell()
+
+    def close(self):
+
+        self.writeobject(2, b'<< /Type /Pages /Count %d /Kids [ %s ] >>' % (
+            len(self.kids), b' '.join(b'%d 0 R' % n for n in self.kids)))
+        self.writeobject(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref = self.file.tell()
+        self.file.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(self.offsets) + 1))
+        for offset in self.offsets:
+            self.file.write(b'%010d 00000 n \n' % offset)
+        self.file.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(self.offsets) + 1, xref))
+
+        self.file.close()
+
+RUNPATTERN = re.compile(r'<pattern id="row-([0-9a-f]{2})".*?</pattern>', re.DOTALL)
+RUNRECT = re.compile(r'<rect transform="([^"]*)" width="[^"]*" height="([^"]*)" fill="url\(#row-([0-9a-f]{2})\)"/>')
+PATTERNHOLE = re.compile(r'<circle cx="([^"]*)" cy="[^"]*" r="([^"]*)" fill="([^"]*)"/>')
+
+# svglib does not fill with patterns, so for the PDF the runs are drawn as
+# paths of holes instead.
+def expandruns(svg):
+
+    patterns = { m.group(1): PATTERNHOLE.findall(m.group(0)) for m in RUNPATTERN.finditer(svg) }
+
+    def expand(m):
+        (transform, height, data) = m.groups()
+
+        fills = {}
+        for row in range(int(round(float(height) / 0.1))):
+            for (cx, r, fill) in patterns[data]:
+                fills.setdefault(fill, []).append(holesubpath(float(cx), row * 0.1 + 0.05, float(r)))
+
+        return ''.join('<path transform="{transform}" fill="{fill}" d="{d}"/>'.format(
+            transform = transform,
+            fill = fill,
+            d = ''.join(holes)
+        ) for (fill, holes) in fills.items())
+
+    return RUNRECT.sub(expand, RUNPATTERN.sub('', svg))
+
+# Turn the SVG of one page into a one page PDF. This is what takes the time, so
+# it runs in worker processes.
+def pagetoPDF(svg, pagesize):
+
+    # The pagesize argument is a tuple of two numbers in points (1/72 of an inch). 
+    c = canvas.Canvas(None, pagesize = (pagesize[0] * 72, pagesize[1] * 72))
+
+    if b'url(#row-' in svg:
+        svg = expandruns(svg.decode('utf-8')).encode('utf-8')
+    drawing = svg2rlg(io.BytesIO(svg))
+
+    renderPDF.draw(drawing, c, 0, 0)
+    c.showPage()
+
+    return c.getpdfdata()
+
+# The pages as PDF, in order. A few pages per worker are kept in flight rather
+# than holding every page of a long tape in memory at once.
+def readpagePDFs(pagefilenames):
+
+    workers = options.pdfworkers or os.cpu_count() or 1
+    if workers == 1 or len(pagefilenames) == 1:
+        for pagefilename in pagefilenames:
+            yield pagetoPDF(readpage(pagefilename), options.pagesize)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = setup_workerlogging, initargs = (logging.getLogger().level,)) as executor:
+        pending = collections.deque()
+        for pagefilename in pagefilenames:
+            pending.append(executor.submit(pagetoPDF, readpage(pagefilename), options.pagesize))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+# File name of a PDF volume, numbered like the pages when the PDF is split.
+def volumefilename(volume):
+
+    if not (options.volumepages or options.volumesize):
+        return options.pdffilename
+
+    (basename, ext) = os.path.splitext(options.pdffilename)
+    return '{basename}.{volume}{ext}'.format(basename = basename, volume = volume, ext = ext)
+
 def convertpagestoPDF():
 
     logger = logging.getLogger('main')
@@ -831,24 +2000,32 @@ def convertpagestoPDF():
         ))
 
     pdfpagecount = 0
+    options.pdffilenames = []
+    pdf = None
 
-    # The pagesize argument is a tuple of two numbers in points (1/72 of an inch). 
-    c = canvas.Canvas(options.pdffilename, pagesize = (options.pagesize[0] * 72, options.pagesize[1] * 72))    
+    for pagedata in readpagePDFs(options.pagefilenames): 
+        if pdf is None:
+            options.pdffilenames.append(volumefilename(len(options.pdffilenames) + 1))
+            pdf = StreamingPDF(options.pdffilenames[-1])
 
-    for pagefilename in options.pagefilenames: 
-        drawing = svg2rlg(pagefilename)
-        renderPDF.draw(drawing, c, 0, 0)
-        c.showPage()
+        pdf.addpage(pagedata)
         pdfpagecount += 1   
         logger.debug('Generated page #{n}.'.format(
             n = pdfpagecount
         )) 
 
-    c.save()
+        if (options.volumepages and len(pdf.kids) >= options.volumepages) or (options.volumesize and pdf.size() >= options.volumesize * 1024 * 1024):
+            pdf.close()
+            pdf = None
 
-    logger.info('Generated {pdfpagecount} page{s} of PDF.'.format(
+    if pdf is not None:
+        pdf.close()
+
+    logger.info('Generated {pdfpagecount} page{s} of PDF in {volumes} file{vs}.'.format(
         pdfpagecount = pdfpagecount,
-        s = 's' if pdfpagecount>1 else ''
+        s = 's' if pdfpagecount>1 else '',
+        volumes = len(options.pdffilenames),
+        vs = 's' if len(options.pdffilenames)>1 else ''
     ))
 
 
@@ -859,6 +2036,149 @@ def main():
     parse_commandline()
     setup_logging()
 
+    logger = logging.getLogger('main')
+
+    # Data that does not fit the encoding is reported, not dumped as a traceback.
+    try:
+        render()
+    except ValueError as e:
+        logger.error(e)
+        sys.exit(2)
+
+# A function as module.function for the profile reports.
+def profilename(filename, function):
+
+    # Built in functions come without a file.
+    if filename == '~':
+        return function
+
+    module = os.path.splitext(os.path.basename(filename))[0]
+    if module == '__init__':
+        module = os.path.basename(os.path.dirname(filename))
+
+    return module + '.' + function
+
+# Looks at the stack every few milliseconds of CPU time and counts how often
+# each stack is seen. The profiling timer interrupts the main thread wherever
+# it is, a thread of its own would only get to look while the main thread
+# lets go of the GIL, mostly for I/O, and would see little else.
+#
+# Only Python functions are on the stack, the time of built-ins like
+# str.format counts for the function calling them.
+class Sampler:
+
+    def __init__(self, phase, interval):
+
+        self.phase = phase
+        self.interval = interval
+        self.stacks = collections.Counter()
+
+    def sample(self, signum, frame):
+
+        stack = []
+        while frame is not None and frame.f_code.co_name != 'profilephase':
+            stack.append(profilename(frame.f_code.co_filename, frame.f_code.co_name))
+            frame = frame.f_back
+
+        self.stacks[';'.join([self.phase] + stack[::-1])] += 1
+
+    def start(self):
+
+        self.cputime = time.process_time()
+        self.previous = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous)
+        self.cputime = time.process_time() - self.cputime
+
+# Run one phase of the work, under the profiler if asked to, and report the
+# functions that took the most time in it.
+def profilephase(phase, function):
+
+    global options
+
+    logger = logging.getLogger('main')
+
+    if options.profile == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.runcall(function)
+
+        pstatsfilename = '{basename}.{phase}.pstats'.format(basename = options.profilebasename, phase = phase)
+        profiler.dump_stats(pstatsfilename)
+        logger.info('Saved the {phase} profile in {pstatsfilename}.'.format(phase = phase, pstatsfilename = pstatsfilename))
+
+        # Time spent in each function itself.
+        stats = pstats.Stats(profiler).stats
+        total = sum(tt for (_, _, tt, _, _) in stats.values()) or 1
+        hot = sorted(((tt, calls, profilename(filename, name)) for ((filename, _, name), (_, calls, tt, _, _)) in stats.items()), reverse = True)
+        for (tt, calls, name) in hot[:10]:
+            logger.info('{phase}: {name} {time:.3f}s ({share:.0f}%) in {calls} calls.'.format(
+                phase = phase,
+                name = name,
+                time = tt,
+                share = 100 * tt / total,
+                calls = calls
+            ))
+
+    elif options.profile == 'sample':
+        sampler = Sampler(phase, options.profileinterval)
+        sampler.start()
+        try:
+            function()
+        finally:
+            sampler.stop()
+
+        options.profilestacks.update(sampler.stacks)
+
+        # The timer fires no more often than the system allows and not while
+        # a long built-in runs, so say how often it really did.
+        samples = sum(sampler.stacks.values())
+        logger.info('{phase}: {samples} samples in {cputime:.2f}s of CPU time, one every {every:.1f}ms.'.format(
+            phase = phase,
+            samples = samples,
+            cputime = sampler.cputime,
+            every = 1000 * sampler.cputime / (samples or 1)
+        ))
+
+        # Samples in each function itself.
+        leaves = collections.Counter()
+        for (stack, count) in sampler.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        for (name, count) in leaves.most_common(10):
+            logger.info('{phase}: {name} {share:.0f}% of {total} samples.'.format(
+                phase = phase,
+                name = name,
+                share = 100 * count / total,
+                total = total
+            ))
+
+    else:
+        function()
+
+# Collapsed stacks, one line each with its count, as flamegraph.pl and
+# speedscope read them.
+def writeprofilestacks():
+
+    global options
+
+    logger = logging.getLogger('main')
+
+    stacksfilename = options.profilebasename + '.collapsed'
+    with open(stacksfilename, 'w') as stacksfile:
+        for (stack, count) in sorted(options.profilestacks.items()):
+            stacksfile.write('{stack} {count}\n'.format(stack = stack, count = count))
+
+    logger.info('Saved the sampled stacks in {stacksfilename}.'.format(stacksfilename = stacksfilename))
+
+# Render the pages and the PDF for the current options.
+def render():
+
+    global options
+
     logger = logging.getLogger('main')
     logger.info('Starting. Writing to {outputfilename}.'.format(
         outputfilename=options.outputfilename))
@@ -875,16 +2195,83 @@ def main():
         bottom = options.marginbottom
     ))
 
-    logger.debug('Create front pages.')
-    createpages(False)
-
-    logger.debug('Create back pages.')
-    createpages(True) 
+    profilephase('svg', renderpages)
 
     if options.pdffilename:
-        convertpagestoPDF()    
+        profilephase('pdf', convertpagestoPDF)
+
+    if options.profile == 'sample':
+        writeprofilestacks()
+
+    # Finished, nothing left to resume.
+    if options.checkpoint and os.path.exists(options.checkpointfilename):
+        os.remove(options.checkpointfilename)
         
     logger.info('Done.')
 
+# The tape as a page to view in the browser, see viewer.py.
+def writeHTML():
+
+    global options
+
+    logger = logging.getLogger('main')
+
+    title = options.punchtitle or os.path.basename(options.inputfilename or '') or 'tape2svg'
+    with open(options.htmlfilename, 'wb') as htmlfile:
+        viewer.write(htmlfile, options.tape, title, options.tapecolor, options.holecolor)
+
+    logger.info('Wrote the viewer for {rows} rows to {htmlfilename}.'.format(
+        rows = len(options.tape),
+        htmlfilename = options.htmlfilename
+    ))
+
+# Render the pages, front and back.
+def renderpages():
+
+    global options
+
+    logger = logging.getLogger('main')
+
+    if options.packfilename:
+        if options.checkpoint or options.resume:
+            logger.warning('Packed pages are not checkpointed.')
+            options.checkpoint = False
+
+        logger.debug('Pack front pages.')
+        packpages(False)
+
+        logger.debug('Pack back pages.')
+        packpages(True)
+    else:
+        options.tape = buildtape(options.leadin, options.punchtitle, options.fontname, inputbytes(), options.leadout)
+        logger.debug('Tape of {rows} rows, CRC-32 {crc:08x}.'.format(rows=len(options.tape), crc=options.tape.crc))
+
+        if options.htmlfilename:
+            writeHTML()
+
+        # Sides that were completed before the interruption are not rendered again.
+        done = []
+        if options.resume and os.path.exists(options.checkpointfilename):
+            state = readcheckpoint()
+            options.pagefilenames = state['pagefilenames']
+            if state['reverse']:
+                done.append(False)
+            if state['sidedone']:
+                done.append(state['reverse'])
+            else:
+                options.resumestate = state
+        elif options.resume:
+            logger.warning('No checkpoint in {checkpointfilename}, starting from the beginning.'.format(
+                checkpointfilename = options.checkpointfilename
+            ))
+
+        if not False in done:
+            logger.debug('Create front pages.')
+            createpages(False)
+
+        if not True in done:
+            logger.debug('Create back pages.')
+            createpages(True)
+
 if __name__ == '__main__':
     main()
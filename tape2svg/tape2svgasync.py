@@ -0,0 +1,354 @@
+import os
+import sys
+import queue
+import shlex
+import asyncio
+import weakref
+import logging
+import argparse
+import multiprocessing
+import concurrent.futures
+
+import tape2svg
+
+# An asyncio front end to tape2svg for serving many users at once. Each job is
+# rendered in a worker process of its own, where tape2svg's global options
+# cannot get in the way of other jobs, and the pages come back one by one as
+# they are finished:
+#
+#   async with Renderer(workers=4) as renderer:
+#       job = await renderer.submit(['-pt', 'Visitor 42', '-ps', 'A4'], timeout=60)
+#       async for (filename, page) in job:
+#           ...
+#       result = await job.result()
+#
+# A job's pages wait in a queue of a few pages only. When the consumer falls
+# behind the worker stops until there is room again. A consumer that stops
+# reading early should cancel the job or close it with aclose(). Jobs that
+# are dropped or still running when the renderer closes are cancelled, so
+# no worker is left waiting for room in a queue nobody reads.
+
+class JobCancelled(Exception):
+    pass
+
+# Set in each worker process for the job it is rendering.
+pages = None
+cancelled = None
+
+# Hands every finished page to the job's queue instead of writing a file.
+class QueueSink(tape2svg.MemorySink):
+
+    def flush(self):
+
+        if cancelled.is_set():
+            raise JobCancelled('Job cancelled.')
+        super().flush()
+
+    def finish(self):
+
+        super().finish()
+
+        # The PDF is made from the pages at the end, keep them only for that.
+        if tape2svg.options.pdffilename:
+            page = tape2svg.options.memorypages[self.filename]
+        else:
+            page = tape2svg.options.memorypages.pop(self.filename)
+
+        putpage((self.filename, page.encode('utf-8')))
+
+# Wait for room in the queue, but not for a consumer that has given up.
+def putpage(item):
+
+    while True:
+        if cancelled.is_set():
+            raise JobCancelled('Job cancelled.')
+        try:
+            pages.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+# Runs in a worker process.
+def renderjob(args, data, jobpages, jobcancelled):
+
+    global pages
+    global cancelled
+
+    (pages, cancelled) = (jobpages, jobcancelled)
+
+    try:
+        tape2svg.parse_commandline(args)
+        if tape2svg.options.checkpoint or tape2svg.options.resume:
+            raise ValueError('Jobs are not checkpointed.')
+        if tape2svg.options.fillworkers:
+            raise ValueError('Jobs hand their pages back through a queue, fill workers need page files.')
+
+        tape2svg.SINKS['queue'] = QueueSink
+        tape2svg.options.sink = 'queue'
+
+        if data is not None:
+            tape2svg.options.inputdata = lambda: data
+
+        tape2svg.render()
+
+        return {
+            'pagefilenames': tape2svg.options.pagefilenames,
+            'pdffilenames': tape2svg.options.pdffilenames
+        }
+
+    except SystemExit:
+        # argparse has already explained on stderr.
+        raise ValueError('Invalid arguments {args}.'.format(args=args))
+
+    finally:
+        # No more pages.
+        try:
+            putpage(None)
+        except JobCancelled:
+            pass
+
+# Wait a little for the next page, in a thread.
+def getpage(jobpages):
+
+    try:
+        return jobpages.get(timeout=0.1)
+    except queue.Empty:
+        return queue.Empty
+
+class Job:
+
+    def __init__(self, renderer, future, jobpages, jobcancelled, timeout):
+
+        self.renderer = renderer
+        self.future = future
+        self.pages = jobpages
+        self.cancelled = jobcancelled
+
+        loop = asyncio.get_running_loop()
+        self.deadline = (loop.time() + timeout) if timeout else None
+
+        self.done = False
+
+        renderer.jobs.add(self)
+
+        # The slot is free again once the worker is done with the job, even
+        # if nobody reads its pages to the end.
+        future.add_done_callback(lambda _: releasesoon(loop, weakref.ref(self)))
+
+        # A job that is dropped without a word is cancelled.
+        weakref.finalize(self, cancelquietly, jobcancelled)
+
+    def cancel(self):
+
+        self.cancelled.set()
+
+    # Stop the job when its pages are no longer wanted.
+    async def aclose(self):
+
+        if not self.future.done():
+            self.cancel()
+        self.release()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+
+        loop = asyncio.get_running_loop()
+
+        try:
+            while not self.done:
+                if self.cancelled.is_set():
+                    raise JobCancelled('Job cancelled.')
+                if self.deadline and loop.time() > self.deadline:
+                    self.cancel()
+                    raise asyncio.TimeoutError('Job timed out.')
+
+                item = await loop.run_in_executor(None, getpage, self.pages)
+                if item is None:
+                    self.done = True
+                elif item is not queue.Empty:
+                    return item
+
+        except BaseException:
+            # Also when the consumer itself is cancelled: stop the worker.
+            self.cancel()
+            self.release()
+            raise
+
+        self.release()
+        raise StopAsyncIteration
+
+    # Wait for the job to finish, whether the pages were read or not.
+    async def result(self):
+
+        try:
+            async for _ in self:
+                pass
+            return await asyncio.wrap_future(self.future)
+        finally:
+            self.release()
+
+    def release(self):
+
+        if not self.renderer is None:
+            self.renderer.slots.release()
+            self.renderer.jobs.discard(self)
+            self.renderer = None
+
+# Cancel a dropped job, unless the manager holding the event is gone already.
+def cancelquietly(jobcancelled):
+
+    try:
+        jobcancelled.set()
+    except (OSError, EOFError):
+        pass
+
+# Release a job's slot from the pool's thread, unless the loop is gone.
+def releasesoon(loop, jobref):
+
+    def release():
+        job = jobref()
+        if job is not None:
+            job.release()
+
+    try:
+        loop.call_soon_threadsafe(release)
+    except RuntimeError:
+        pass
+
+class Renderer:
+
+    def __init__(self, workers=None, queuesize=4, maxjobs=None):
+
+        self.workers = workers or os.cpu_count() or 1
+        self.queuesize = queuesize
+
+        # Jobs waiting for a worker are limited too, submit() waits for a slot.
+        self.slots = asyncio.Semaphore(maxjobs or 2 * self.workers)
+
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        self.manager = multiprocessing.Manager()
+
+        # Jobs that have not been released yet, see close().
+        self.jobs = weakref.WeakSet()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+
+        # A worker may be waiting for room in the queue of a job nobody
+        # reads any more. Shutting down would wait for it forever.
+        for job in list(self.jobs):
+            job.cancel()
+
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.manager.shutdown()
+
+    async def submit(self, args, data=None, timeout=None):
+
+        await self.slots.acquire()
+
+        jobpages = self.manager.Queue(self.queuesize)
+        jobcancelled = self.manager.Event()
+        future = self.executor.submit(renderjob, args, data, jobpages, jobcancelled)
+
+        return Job(self, future, jobpages, jobcancelled, timeout)
+
+# Set up argparse and get the command line options.
+def parse_commandline():
+
+    global options
+
+    parser = argparse.ArgumentParser(
+        description = 'Render several tapes at once through the asyncio API, as a local client to try it out.',
+    )
+
+    parser.add_argument('jobs',
+        nargs = '+',
+        help = 'tape2svg options for one tape, quoted as one argument each',
+        metavar = 'job'
+    )
+
+    parser.add_argument('-ll', '--log-level',
+        action = 'store',
+        default = 'INFO',
+        help ='Set the logging output level to CRITICAL, ERROR, WARNING, INFO or DEBUG (default: %(default)s)',
+        dest ='log_level',
+        metavar = 'level'
+    )
+
+    parser.add_argument('-w', '--workers',
+        action = 'store',
+        default = 0,
+        type = int,
+        help = 'Number of worker processes, 0 for one per CPU (default: %(default)s)',
+        dest = 'workers',
+        metavar = 'count'
+    )
+
+    parser.add_argument('-t', '--timeout',
+        action = 'store',
+        default = 0,
+        type = float,
+        help = 'Give up on a job after this many seconds, 0 to wait as long as it takes (default: %(default)s)',
+        dest = 'timeout',
+        metavar = 'seconds'
+    )
+
+    options = parser.parse_args()
+    options.log_level_int = getattr(logging, options.log_level, logging.INFO)
+
+def setup_logging():
+
+    global options
+
+    ch = logging.StreamHandler()
+    ch.setLevel(options.log_level_int)
+    ch.setFormatter(logging.Formatter('[{levelname:7}] {name} - {message}', style='{'))
+
+    root = logging.getLogger()
+    root.addHandler(ch)
+    root.setLevel(options.log_level_int)
+
+# Read one job's pages as they come and write them out.
+async def runjob(renderer, n, args):
+
+    logger = logging.getLogger('main')
+
+    try:
+        job = await renderer.submit(args, timeout=options.timeout)
+        async for (filename, page) in job:
+            with open(filename, 'wb') as pagefile:
+                pagefile.write(page)
+            logger.info('Job #{n}: {filename}.'.format(n=n, filename=filename))
+
+        result = await job.result()
+        logger.info('Job #{n} done, {pages} pages.'.format(n=n, pages=len(result['pagefilenames'])))
+        return True
+
+    except (JobCancelled, asyncio.TimeoutError, ValueError, OSError) as e:
+        logger.error('Job #{n}: {error}'.format(n=n, error=str(e) or type(e).__name__))
+        return False
+
+async def runjobs():
+
+    async with Renderer(workers=options.workers) as renderer:
+        return await asyncio.gather(*(runjob(renderer, n + 1, shlex.split(args)) for (n, args) in enumerate(options.jobs)))
+
+def main():
+
+    global options
+
+    parse_commandline()
+    setup_logging()
+
+    if not all(asyncio.run(runjobs())):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import base64
+import socket
+
+# Thin client for tape2svgd. Takes the same command line as tape2svg.py and has
+# the job rendered by the daemon, which has everything loaded already.
+#
+#   TAPE2SVG_SOCKET  path of the daemon's socket (default: /tmp/tape2svg.sock)
+#   TAPE2SVG_INLINE  when set send the input file's bytes along instead of its
+#                    name, for daemons that cannot see the client's files
+#   TAPE2SVG_STREAM  when set to a directory have the output files streamed
+#                    back and written there
+
+DEFAULTSOCKET = '/tmp/tape2svg.sock'
+
+# Both sides speak in messages: one line of JSON, optionally followed by as
+# many raw bytes as the header announces in 'length'.
+def sendmessage(sock, header, payload=b''):
+
+    header = dict(header, length=len(payload))
+    sock.sendall(json.dumps(header).encode() + b'\n' + payload)
+
+def receivemessage(reader):
+
+    line = reader.readline()
+    if not line:
+        raise EOFError('Connection closed.')
+
+    header = json.loads(line)
+    payload = reader.read(header.get('length', 0))
+
+    return (header, payload)
+
+def render(args, socketpath=DEFAULTSOCKET, data=None, stream=False):
+
+    job = { 'args': args, 'cwd': os.getcwd(), 'stream': stream }
+    if data is not None:
+        job['data'] = base64.b64encode(data).decode('ascii')
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socketpath)
+        sendmessage(sock, job)
+
+        with sock.makefile('rb') as reader:
+            (result, _) = receivemessage(reader)
+
+            # Streamed files follow the result, one message each.
+            files = {}
+            for _ in range(len(result.get('streamed', []))):
+                (header, payload) = receivemessage(reader)
+                files[header['filename']] = payload
+
+    return (result, files)
+
+def main():
+
+    args = sys.argv[1:]
+    socketpath = os.environ.get('TAPE2SVG_SOCKET', DEFAULTSOCKET)
+    streamdir = os.environ.get('TAPE2SVG_STREAM', '')
+
+    data = None
+    if os.environ.get('TAPE2SVG_INLINE'):
+        # Hand over the bytes and leave the file name out.
+        for flag in ('-if', '--input-file'):
+            if flag in args:
+                i = args.index(flag)
+                with open(args[i + 1], 'rb') as inputfile:
+                    data = inputfile.read()
+                args = args[:i] + args[i + 2:]
+
+    (result, files) = render(args, socketpath, data, bool(streamdir))
+
+    if not result['ok']:
+        sys.exit('tape2svg: ' + result['error'])
+
+    for (filename, payload) in files.items():
+        with open(os.path.join(streamdir, os.path.basename(filename)), 'wb') as outputfile:
+            outputfile.write(payload)
+
+    for filename in result['pagefilenames'] + result['pdffilenames']:
+        print(filename)
+
+if __name__ == '__main__':
+    main()
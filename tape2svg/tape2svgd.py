@@ -0,0 +1,125 @@
+import os
+import sys
+import base64
+import logging
+import argparse
+import socketserver
+
+import tape2svg
+import tape2svgc
+
+# Set up argparse and get the command line options.
+def parse_commandline():
+
+    global options
+
+    parser = argparse.ArgumentParser(
+        description = 'Keep tape2svg loaded and render jobs sent by tape2svgc over a Unix domain socket.',
+    )
+
+    parser.add_argument('-ll', '--log-level',
+        action = 'store',
+        default = 'INFO',
+        help ='Set the logging output level to CRITICAL, ERROR, WARNING, INFO or DEBUG (default: %(default)s)',
+        dest ='log_level',
+        metavar = 'level'
+    )
+
+    parser.add_argument('-s', '--socket',
+        action = 'store',
+        default = tape2svgc.DEFAULTSOCKET,
+        help = 'Path of the socket to listen on (default: %(default)s)',
+        dest = 'socketpath',
+        metavar = 'path'
+    )
+
+    options = parser.parse_args()
+
+# Run one job like tape2svg.py would with these arguments. Jobs are rendered
+# one after the other as tape2svg keeps its state in its global options.
+# Returns the result for the client and the pages rendered to memory.
+def renderjob(job):
+
+    logger = logging.getLogger('main')
+
+    cwd = os.getcwd()
+    try:
+        os.chdir(job['cwd'])
+
+        # Pages that are streamed back never need to touch the disk.
+        args = job['args']
+        if job.get('stream') and not ('-sk' in args or '--sink' in args):
+            args = args + ['-sk', 'memory']
+
+        tape2svg.parse_commandline(args)
+        if 'data' in job:
+            data = base64.b64decode(job['data'])
+            tape2svg.options.inputdata = lambda: data
+
+        tape2svg.render()
+
+        return ({
+            'ok': True,
+            'pagefilenames': [os.path.abspath(f) for f in tape2svg.options.pagefilenames],
+            'pdffilenames': [os.path.abspath(f) for f in tape2svg.options.pdffilenames]
+        }, { os.path.abspath(f): page.encode('utf-8') for (f, page) in tape2svg.options.memorypages.items() })
+
+    except SystemExit:
+        # argparse has already explained on stderr.
+        return ({ 'ok': False, 'error': 'Invalid arguments {args}.'.format(args=job['args']) }, {})
+
+    except Exception as e:
+        logger.exception('Job failed.')
+        return ({ 'ok': False, 'error': str(e) }, {})
+
+    finally:
+        os.chdir(cwd)
+
+class JobHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+
+        (job, _) = tape2svgc.receivemessage(self.rfile)
+        (result, pages) = renderjob(job)
+
+        files = []
+        if result['ok'] and job.get('stream'):
+            files = result['pagefilenames'] + result['pdffilenames']
+            result['streamed'] = files
+
+        tape2svgc.sendmessage(self.connection, result)
+
+        for filename in files:
+            if filename in pages:
+                payload = pages[filename]
+            else:
+                with open(filename, 'rb') as f:
+                    payload = f.read()
+            tape2svgc.sendmessage(self.connection, { 'filename': filename }, payload)
+
+def main():
+
+    global options
+
+    parse_commandline()
+
+    # tape2svg's own logging, set up once for all jobs.
+    tape2svg.parse_commandline(['-ll', options.log_level])
+    tape2svg.setup_logging()
+
+    logger = logging.getLogger('main')
+
+    if os.path.exists(options.socketpath):
+        os.remove(options.socketpath)
+
+    with socketserver.UnixStreamServer(options.socketpath, JobHandler) as server:
+        logger.info('Listening on {socketpath}.'.format(socketpath=options.socketpath))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(options.socketpath)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import unittest
+
+import tape2svgasync
+
+# Renders a tape of several pages in a thread, so a hang shows as a thread
+# that is still alive.
+def runinthread(consume, timeout=60):
+
+    outcome = {}
+
+    def run():
+        outcome['result'] = asyncio.run(consume())
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+
+    return (thread.is_alive(), outcome.get('result'))
+
+ARGS = ['-ps', 'A4', '-li', '0', '-lo', '0']
+DATA = bytes(range(256)) * 20
+
+class TestRenderer(unittest.TestCase):
+
+    def test_break_out_early(self):
+
+        async def consume():
+            async with tape2svgasync.Renderer(workers=1, queuesize=1) as renderer:
+                job = await renderer.submit(ARGS, data=DATA)
+                async for (filename, page) in job:
+                    break
+                return page
+
+        (hung, page) = runinthread(consume)
+
+        self.assertFalse(hung, 'Renderer did not close after the consumer left early.')
+        self.assertTrue(page.startswith(b'<?xml'))
+
+    def test_aclose(self):
+
+        async def consume():
+            async with tape2svgasync.Renderer(workers=1, queuesize=1) as renderer:
+                job = await renderer.submit(ARGS, data=DATA)
+                async for _ in job:
+                    break
+                await job.aclose()
+
+                # The slot is free again and the next job runs to the end.
+                job = await renderer.submit(ARGS + ['-pt', 'Hi'])
+                return await job.result()
+
+        (hung, result) = runinthread(consume)
+
+        self.assertFalse(hung, 'Renderer did not close after aclose().')
+        self.assertEqual(len(result['pagefilenames']), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,276 @@
+import json
+import html
+import base64
+import string
+
+import codes
+
+# A tape as a single HTML file to look at in a browser. The rows are in the
+# file as base64, about a third more than the data itself, and a small script
+# draws only the rows that are in view onto a canvas. Nothing depends on the
+# length of the tape except the size of the file, so it opens right away
+# however long the tape is.
+#
+# The page is scrolled with an empty element as tall as the tape. Browsers do
+# not make elements taller than a few million pixels, for longer tapes the
+# scroll position is scaled to the rows.
+
+# Rows encoded per block, a multiple of three so each block is whole base64
+# groups and can be decoded on its own.
+BLOCKROWS = 3 << 16
+
+TEMPLATE = string.Template('''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<style>
+    html, body { margin: 0; height: 100%; overflow: hidden; font: 13px monospace; background: #eee; }
+    #bar { position: absolute; top: 0; left: 0; right: 0; height: 36px; padding: 6px 10px; box-sizing: border-box; background: #333; color: #eee; }
+    #bar input { width: 10em; }
+    #tape { position: absolute; top: 36px; left: 0; }
+    #view { position: absolute; top: 36px; bottom: 0; left: 0; right: 0; overflow-y: scroll; }
+    #spacer { width: 1px; }
+</style>
+</head>
+<body>
+<div id="bar">
+    $title &mdash;
+    <select id="segment"></select>
+    <input id="offset" placeholder="offset, 0x for hex">
+    <button id="go">Go</button>
+    <span id="status"></span>
+</div>
+<canvas id="tape"></canvas>
+<div id="view"><div id="spacer"></div></div>
+<script type="application/json" id="config">$config</script>
+<script type="application/octet-stream" id="rows">$rows</script>
+<script>
+"use strict";
+
+const config = JSON.parse(document.getElementById('config').textContent);
+const encoded = document.getElementById('rows').textContent;
+
+// 0.1in per row at 200 pixels per inch.
+const SCALE = 200;
+const ROW = 0.1 * SCALE;
+const MAXHEIGHT = 8000000;
+
+const view = document.getElementById('view');
+const spacer = document.getElementById('spacer');
+const canvas = document.getElementById('tape');
+const context = canvas.getContext('2d');
+const segmentselect = document.getElementById('segment');
+const offsetinput = document.getElementById('offset');
+const statusline = document.getElementById('status');
+
+// The rows are decoded a block at a time as they come into view, and only
+// the last few blocks are kept.
+const blocks = new Map();
+
+function block(n) {
+    let rows = blocks.get(n);
+    if (!rows) {
+        const chars = config.blockrows / 3 * 4;
+        const text = atob(encoded.substr(n * chars, chars));
+        rows = new Uint8Array(text.length);
+        for (let i = 0; i < text.length; i++) {
+            rows[i] = text.charCodeAt(i);
+        }
+        if (blocks.size >= 16) {
+            blocks.delete(blocks.keys().next().value);
+        }
+        blocks.set(n, rows);
+    }
+    return rows;
+}
+
+function row(i) {
+    return block(Math.floor(i / config.blockrows))[i % config.blockrows];
+}
+
+function segmentof(i) {
+    for (const segment of config.segments) {
+        if (i < segment.start + segment.length) {
+            return segment;
+        }
+    }
+    return config.segments[config.segments.length - 1];
+}
+
+function hex(value, digits) {
+    return '0x' + value.toString(16).padStart(digits, '0');
+}
+
+let target = -1;
+
+// The row at the top of the view, with a fraction when scrolled between two.
+// On long tapes a pixel of the scroll bar is many rows, so the wheel moves
+// the rows and the scroll bar follows, not the other way round.
+let position = 0;
+let scrolled = 0;
+
+function scrollable() {
+    return Math.max(1, spacer.offsetHeight - view.clientHeight);
+}
+
+function lasttop() {
+    return Math.max(0, config.rows - view.clientHeight / ROW);
+}
+
+function scrollto(top) {
+    position = Math.max(0, Math.min(lasttop(), top));
+    scrolled = Math.round(position / Math.max(1, lasttop()) * scrollable());
+    view.scrollTop = scrolled;
+    draw();
+}
+
+function draw() {
+    const width = view.clientWidth;
+    const height = view.clientHeight;
+    const ratio = window.devicePixelRatio || 1;
+
+    if (canvas.width != width * ratio || canvas.height != height * ratio) {
+        canvas.width = width * ratio;
+        canvas.height = height * ratio;
+        canvas.style.width = width + 'px';
+        canvas.style.height = height + 'px';
+    }
+    context.setTransform(ratio, 0, 0, ratio, 0, 0);
+    context.clearRect(0, 0, width, height);
+
+    const top = position;
+    const first = Math.floor(top);
+    const last = Math.min(config.rows, first + Math.ceil(height / ROW) + 1);
+    const shift = (top - first) * ROW;
+    const left = Math.max(180, (width - config.width * SCALE) / 2);
+
+    context.fillStyle = config.tapecolor;
+    context.fillRect(left, -shift, config.width * SCALE, (last - first) * ROW);
+
+    context.textBaseline = 'middle';
+    for (let i = first; i < last; i++) {
+        const y = (i - first) * ROW - shift;
+        const cy = y + ROW / 2;
+        const data = row(i);
+        const segment = segmentof(i);
+
+        if (i == target) {
+            context.fillStyle = 'rgba(255, 200, 0, 0.5)';
+            context.fillRect(left - 170, y, config.width * SCALE + 340, ROW);
+        }
+
+        context.fillStyle = config.holecolor;
+        context.beginPath();
+        for (let bit = 0; bit < config.holes.length; bit++) {
+            if ((data >> bit) & 1) {
+                context.moveTo(left + (config.holes[bit] + 0.036) * SCALE, cy);
+                context.arc(left + config.holes[bit] * SCALE, cy, 0.036 * SCALE, 0, 2 * Math.PI);
+            }
+        }
+        context.moveTo(left + (config.feed + 0.023) * SCALE, cy);
+        context.arc(left + config.feed * SCALE, cy, 0.023 * SCALE, 0, 2 * Math.PI);
+        context.fill();
+
+        context.fillStyle = '#333';
+        context.textAlign = 'right';
+        context.fillText(segment.name + ' ' + hex(i - segment.start, 8), left - 10, cy);
+        context.textAlign = 'left';
+        context.fillText(hex(data, 2) + ' ' + (data >= 0x20 && data <= 0x7e ? String.fromCharCode(data) : ' '), left + config.width * SCALE + 10, cy);
+    }
+
+    statusline.textContent = 'rows ' + first + ' to ' + (last - 1) + ' of ' + config.rows;
+}
+
+function jump(i) {
+    target = Math.max(0, Math.min(config.rows - 1, i));
+    scrollto(target - view.clientHeight / ROW / 2);
+}
+
+function go() {
+    const offset = Number(offsetinput.value.trim());
+    if (!Number.isInteger(offset) || offset < 0) {
+        statusline.textContent = 'Not an offset: ' + offsetinput.value;
+        return;
+    }
+    const segment = config.segments[segmentselect.value];
+    jump(segment ? segment.start + offset : offset);
+}
+
+const tapeoption = document.createElement('option');
+tapeoption.value = -1;
+tapeoption.textContent = 'tape';
+segmentselect.appendChild(tapeoption);
+config.segments.forEach(function (segment, n) {
+    const option = document.createElement('option');
+    option.value = n;
+    option.textContent = segment.name + ' (' + segment.length + ' rows)';
+    segmentselect.appendChild(option);
+    if (segment.name == 'data') {
+        option.selected = true;
+    }
+});
+
+spacer.style.height = Math.min(config.rows * ROW, MAXHEIGHT) + 'px';
+
+let pending = false;
+view.addEventListener('scroll', function () {
+    // Dragging the scroll bar moves to the rows it points at.
+    if (Math.abs(view.scrollTop - scrolled) > 1) {
+        scrolled = view.scrollTop;
+        position = Math.min(scrolled / scrollable(), 1) * lasttop();
+    }
+    if (!pending) {
+        pending = true;
+        window.requestAnimationFrame(function () { pending = false; draw(); });
+    }
+});
+view.addEventListener('wheel', function (event) {
+    event.preventDefault();
+    const rows = [1 / ROW, 1, view.clientHeight / ROW][event.deltaMode] * event.deltaY;
+    scrollto(position + rows);
+}, { passive: false });
+window.addEventListener('resize', function () { scrollto(position); });
+document.getElementById('go').addEventListener('click', go);
+offsetinput.addEventListener('keydown', function (event) {
+    if (event.key == 'Enter') {
+        go();
+    }
+});
+
+draw();
+</script>
+</body>
+</html>
+''')
+
+# Write the viewer for the rows of the tape to a file opened in binary mode.
+def write(outfile, rows, title, tapecolor, holecolor):
+
+    layout = codes.LAYOUTS[rows.bitcount]
+    (holes, feed) = codes.holepositions(rows.bitcount)
+
+    config = {
+        'rows': len(rows),
+        'blockrows': BLOCKROWS,
+        'width': layout.width,
+        'holes': holes,
+        'feed': feed,
+        'tapecolor': tapecolor,
+        'holecolor': holecolor,
+        'segments': [segment._asdict() for segment in rows.segments]
+    }
+
+    # The rows go in between the head and the tail, encoded a block at a time
+    # rather than all at once. Script elements are not unescaped by the
+    # browser, only a closing tag in the JSON must not be there.
+    (head, tail) = TEMPLATE.substitute(
+        title = html.escape(title),
+        config = json.dumps(config).replace('</', '<\\/'),
+        rows = '\0'
+    ).split('\0')
+
+    outfile.write(head.encode('utf-8'))
+    for start in range(0, len(rows), BLOCKROWS):
+        outfile.write(base64.b64encode(rows.view(start, start + BLOCKROWS)))
+    outfile.write(tail.encode('utf-8'))